@@ -0,0 +1,140 @@
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from conversions import (  # noqa: E402
+    chunk_nodes, clean_up, convert_doc_to_nodes, convert_to_dict, find_h_level, find_sections_paragraphs, read_tables,
+    render_tables_add_to_nodes_text
+)
+from docx_blocks import read_document  # noqa: E402
+from synthetic_syllabus import make_syllabus  # noqa: E402
+from timeline import read_events  # noqa: E402
+
+STAGES = [
+    "read_document", "find_h_level", "find_sections_paragraphs", "convert_doc_to_nodes", "read_tables", "read_events",
+    "render_tables_add_to_nodes_text", "clean_up", "convert_to_dict", "chunk_nodes",
+]
+
+
+def run_stages(file_bytes: bytes, measure: Callable[[str, Callable[[], Any]], Any]) -> None:
+    """
+    Run the stages of convert_file one by one, each through measure(stage name, stage)
+
+    :param file_bytes: The docx file bytes
+    :param measure: Runs a stage and records its cost
+
+    """
+
+    document = measure("read_document", lambda: read_document(io.BytesIO(file_bytes)))
+    sections = measure("find_h_level", lambda: find_h_level(document))
+    section_paragraphs = measure("find_sections_paragraphs", lambda: find_sections_paragraphs(sections, document))
+    nodes_text = measure("convert_doc_to_nodes", lambda: convert_doc_to_nodes(section_paragraphs, document, sections))
+    doc_tables, table_titles = measure("read_tables", lambda: read_tables(document))
+    events = measure("read_events", lambda: read_events(doc_tables))
+    measure("render_tables_add_to_nodes_text", lambda: render_tables_add_to_nodes_text(table_titles, nodes_text, doc_tables))
+    sorted_nodes_text = measure("clean_up", lambda: clean_up(nodes_text))
+    nodes = measure("convert_to_dict", lambda: convert_to_dict(sorted_nodes_text, events))
+    measure("chunk_nodes", lambda: chunk_nodes(nodes))
+
+
+def time_stages(file_bytes: bytes, repeat: int) -> Dict[str, float]:
+    """
+    Best wall time of each stage over several runs, in seconds
+
+    """
+
+    best: Dict[str, float] = {stage: float("inf") for stage in STAGES}
+
+    def measure(stage: str, function: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = function()
+        best[stage] = min(best[stage], time.perf_counter() - start)
+        return result
+
+    for _ in range(repeat):
+        gc.collect()
+        run_stages(file_bytes, measure)
+
+    return best
+
+
+def peak_memory_stages(file_bytes: bytes) -> Dict[str, int]:
+    """
+    Peak memory allocated by each stage, in bytes. Measured in a separate run because tracemalloc slows everything down
+
+    """
+
+    peaks: Dict[str, int] = {}
+
+    def measure(stage: str, function: Callable[[], Any]) -> Any:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = function()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - baseline
+        return result
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_stages(file_bytes, measure)
+    finally:
+        tracemalloc.stop()
+
+    return peaks
+
+
+def parse_scales(value: str) -> List[int]:
+    return [int(scale) for scale in value.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the stages of convert_file on synthetic syllabi of growing size.")
+    parser.add_argument("--scales", type=parse_scales, default=[1, 2, 4, 8], help="Comma-separated size multipliers (default: 1,2,4,8)")
+    parser.add_argument("--headings", type=int, default=20, help="Sections at scale 1")
+    parser.add_argument("--paragraphs", type=int, default=5, help="Paragraphs per section")
+    parser.add_argument("--hyperlinks", type=int, default=1, help="Hyperlinks per section")
+    parser.add_argument("--tables", type=int, default=2, help="Generic tables at scale 1, the titled tables are always included")
+    parser.add_argument("--rows", type=int, default=10, help="Rows per table at scale 1")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per size, the best is reported")
+    parser.add_argument("--json", help="Also write the results to this JSON file, to compare runs")
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+
+    for scale in args.scales:
+        file_bytes = make_syllabus(
+            headings=args.headings * scale,
+            paragraphs=args.paragraphs,
+            hyperlinks=args.hyperlinks,
+            tables=args.tables * scale,
+            rows=args.rows * scale,
+        ).getvalue()
+
+        times = time_stages(file_bytes, args.repeat)
+        peaks = peak_memory_stages(file_bytes)
+        results.append({"scale": scale, "bytes": len(file_bytes), "seconds": times, "peak_bytes": peaks})
+
+        print(f"\nscale {scale}: {args.headings * scale} sections, {args.tables * scale} generic tables, "
+              f"{args.rows * scale} rows per table, {len(file_bytes) / 1024:.0f} KiB")
+        print(f"{'stage':<34}{'ms':>10}{'peak KiB':>12}")
+
+        for stage in STAGES:
+            print(f"{stage:<34}{times[stage] * 1000:>10.2f}{peaks[stage] / 1024:>12.0f}")
+
+        print(f"{'total':<34}{sum(times.values()) * 1000:>10.2f}{max(peaks.values()) / 1024:>12.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Backends that must not be loaded by importing the public API
+HEAVY_MODULES = ["docx", "lxml", "pandas", "bs4", "mammoth", "numpy"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import al_types
+from conversions import convert_file, convert_to_dict
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_import(runs: int) -> Dict[str, object]:
+    """
+    Import the public API in fresh interpreters and measure the import time
+
+    :param runs: Number of interpreters to start
+    :return: Median and worst import time in milliseconds, and the heavy modules that were loaded
+
+    """
+
+    times: List[float] = []
+    heavy: List[str] = []
+
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=SRC, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output)
+        times.append(result["seconds"] * 1000)
+        heavy = sorted(set(heavy) | set(result["heavy"]))
+
+    return {"median_ms": statistics.median(times), "max_ms": max(times), "heavy_modules": heavy}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the import time of the conversion API (al_types and conversions).")
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters (default: 10)")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail when the median import time is above this budget")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    result = measure_import(args.runs)
+    print(f"median {result['median_ms']:.1f} ms, max {result['max_ms']:.1f} ms over {args.runs} runs")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(result, json_file, indent=2)
+
+    failed = False
+    if result["heavy_modules"]:
+        print(f"heavy modules imported eagerly: {', '.join(result['heavy_modules'])}", file=sys.stderr)
+        failed = True
+
+    if args.max_ms is not None and result["median_ms"] > args.max_ms:
+        print(f"median import time above the {args.max_ms:.0f} ms budget", file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
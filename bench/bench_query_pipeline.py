@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bm25_index import Bm25Index  # noqa: E402
+from conversions import convert_file  # noqa: E402
+from query_pipeline import ProviderClients, QueryPipeline  # noqa: E402
+from stub_providers import StubProviderServer  # noqa: E402
+from synthetic_syllabus import make_syllabus  # noqa: E402
+
+QUERIES = [
+    "When are the office hours?", "What are the readings for week 3?", "When is the essay due?",
+    "How is the course graded?", "Where is the lecture?", "What is the late policy?",
+]
+
+
+def construct_prompt(query: str, prompt_context: str) -> str:
+    return "Context:\n" + prompt_context + "\n\n=====\n\nQuestion: " + query + " \n\nAnswer:"
+
+
+async def run(server: StubProviderServer, nodes: List[str], queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """
+    Answer the queries through the pipeline against the stub providers
+
+    :param server: The running stub server
+    :param nodes: The nodes texts
+    :param queries: The queries
+    :param concurrency: Concurrency limit of the pipeline
+    :return: Wall time, throughput, errors and the connections opened to the stub
+
+    """
+
+    connections = server.counts["connections"]
+
+    async with ProviderClients("stub", "stub", azure_endpoint=server.url, cohere_base_url=server.url) as clients:
+        pipeline = QueryPipeline(nodes, clients, str.strip, construct_prompt, Bm25Index(nodes), concurrency=concurrency)
+
+        start = time.perf_counter()
+        answers = await pipeline.answer_many(queries)
+        seconds = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "queries_per_second": len(queries) / seconds,
+        "errors": sum(answer["error"] is not None for answer in answers),
+        "connections": server.counts["connections"] - connections,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of the async query pipeline against local stub providers.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries (default: 200)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the stub waits per request (default: 0.05)")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 8, 32],
+                        help="Comma separated concurrency limits (default: 1,8,32)")
+    args = parser.parse_args()
+
+    nodes = [node["text"] for node in convert_file(make_syllabus())]
+    queries = [QUERIES[i % len(QUERIES)] + f" ({i})" for i in range(args.queries)]
+
+    print(f"{'concurrency':>12}{'seconds':>10}{'queries/s':>12}{'errors':>8}{'connections':>13}")
+
+    with StubProviderServer(latency=args.latency) as server:
+        for concurrency in args.concurrency:
+            result = asyncio.run(run(server, nodes, queries, concurrency))
+            print(f"{result['concurrency']:>12}{result['seconds']:>10.2f}{result['queries_per_second']:>12.1f}"
+                  f"{result['errors']:>8}{result['connections']:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import io
+import random
+from typing import List
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+WORDS = (
+    "course students readings lecture tutorial essay history canada assignment presentation quiz "
+    "participation discussion grade submission policy university academic integrity review week"
+).split()
+
+# Title -> header row of the tables that render_tables_add_to_nodes_text renders with a template
+TITLED_TABLES = {
+    "Tutorials": ["Tutorial", "TA", "Time", "Room", "Zoom"],
+    "Faculty Members Information": ["Name", "Role", "Email", "Office Hours", "Office"],
+    "Summary of Evaluation": ["Assignment", "Weight", "Due Date"],
+    "Grading Equivalence": ["Letter Grade", "Grade Point", "Percent Range", "Description"],
+    "Definitions of Standing": ["Standing", "Definition"],
+    "Schedule and Readings": ["Topic", "Readings", "Date"],
+    "Important Dates": ["Event", "Date"],
+}
+
+MONTHS = ["Sep", "Oct", "Nov", "Dec", "Jan", "Feb", "Mar", "Apr"]
+
+
+def sentence(rng: random.Random, length: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def add_hyperlink(paragraph: Paragraph, text: str, url: str) -> None:
+    """
+    Append a hyperlink run to a paragraph (python-docx has no API to create hyperlinks)
+
+    :param paragraph: The paragraph
+    :param text: The text of the link
+    :param url: The url of the link
+
+    """
+
+    r_id = paragraph.part.relate_to(url, RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
+
+    hyperlink = OxmlElement("w:hyperlink")
+    hyperlink.set(qn("r:id"), r_id)
+
+    run = OxmlElement("w:r")
+    text_element = OxmlElement("w:t")
+    text_element.text = text
+    run.append(text_element)
+    hyperlink.append(run)
+
+    paragraph._p.append(hyperlink)
+
+
+def cell_value(rng: random.Random, title: str, column: int, row: int) -> str:
+    if title in ("Schedule and Readings", "Summary of Evaluation", "Important Dates") and column == len(TITLED_TABLES[title]) - 1:
+        return f"{MONTHS[row % len(MONTHS)]} {row % 28 + 1}, 2024"
+
+    if title == "Summary of Evaluation" and column == 1:
+        return f"{rng.randint(5, 30)}%"
+
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+
+
+def add_table(docx_file: Document, title: str, header: List[str], rows: int, rng: random.Random) -> None:
+    docx_file.add_heading(title, 2)
+    table = docx_file.add_table(rows=rows + 1, cols=len(header))
+
+    for column, name in enumerate(header):
+        table.cell(0, column).text = name
+
+    for row in range(1, rows + 1):
+        for column in range(len(header)):
+            table.cell(row, column).text = cell_value(rng, title, column, row)
+
+
+def make_syllabus(
+        headings: int = 20,
+        paragraphs: int = 5,
+        hyperlinks: int = 1,
+        tables: int = 2,
+        rows: int = 10,
+        seed: int = 0
+) -> io.BytesIO:
+    """
+    Generate a synthetic syllabus with the structure convert_file expects
+
+    :param headings: Number of text sections (after Course Information)
+    :param paragraphs: Number of paragraphs per section
+    :param hyperlinks: Number of hyperlinks per section
+    :param tables: Number of generic tables, the titled tables are always included
+    :param rows: Number of rows per table (header excluded)
+    :param seed: Seed of the random text
+    :return: The docx file in a BytesIO buffer
+
+    """
+
+    rng = random.Random(seed)
+    docx_file = Document()
+
+    docx_file.add_paragraph("HUMA 1000", style="Title")
+    docx_file.add_paragraph("Synthetic Course", style="Subtitle")
+
+    docx_file.add_heading("Course Information", 1)
+    for label in ("Course Director:", "Email:", "Semester:", "Lecture time & day:", "Lecture room:", "Office Hours:"):
+        docx_file.add_paragraph(f"{label}\t{sentence(rng, 3)}")
+
+    for heading in range(headings):
+        docx_file.add_heading(f"Section {heading} {rng.choice(WORDS).capitalize()}", 1)
+
+        for paragraph in range(paragraphs):
+            docx_paragraph = docx_file.add_paragraph(sentence(rng) + " ")
+
+            # The links are spread over the first paragraphs of the section
+            if paragraph < hyperlinks:
+                add_hyperlink(docx_paragraph, f"link {heading}-{paragraph}", f"https://example.com/{heading}/{paragraph}")
+
+        for link in range(paragraphs, hyperlinks):
+            add_hyperlink(docx_file.add_paragraph("See "), f"link {heading}-{link}", f"https://example.com/{heading}/{link}")
+
+    docx_file.add_heading("Tables", 1)
+    for title, header in TITLED_TABLES.items():
+        add_table(docx_file, title, header, rows, rng)
+
+    for table in range(tables):
+        add_table(docx_file, f"Table {table}", [f"Column {column}" for column in range(4)], rows, rng)
+
+    buffer = io.BytesIO()
+    docx_file.save(buffer)
+    buffer.seek(0)
+
+    return buffer
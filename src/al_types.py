@@ -1,4 +1,4 @@
-from typing import TypedDict, Literal, Dict, Any
+from typing import TypedDict, Literal, Dict, Any, NamedTuple, Optional, Tuple, Union, List
 
 
 class AlNode(TypedDict):
@@ -7,3 +7,124 @@ class AlNode(TypedDict):
     type: Literal["NarrativeText"]
     metadata: Dict[str, Any]
 
+
+class AlLink(NamedTuple):
+    text: str
+    url: str
+
+
+class AlParagraph(NamedTuple):
+    text: str
+    markdown: str  # The text with its hyperlinks as [text](url)
+    links: Tuple[AlLink, ...]
+    is_heading: bool
+
+
+class AlCell(NamedTuple):
+    text: str
+    url: str
+
+
+class AlTable(NamedTuple):
+    title: Optional[str]  # The heading directly above the table, if any
+    rows: Tuple[Tuple[AlCell, ...], ...]
+
+
+class AlTextTable(NamedTuple):
+    title: str
+    header: Tuple[str, ...]  # The first row of the table
+    rows: Tuple[Tuple[str, ...], ...]  # The rows after the header, cells with a link are "[text] (link)"
+
+
+class AlDocument(NamedTuple):
+    blocks: Tuple[Union[AlParagraph, AlTable], ...]  # Body paragraphs and tables in document order
+    paragraphs: Tuple[AlParagraph, ...]
+    tables: Tuple[AlTable, ...]
+
+
+class AlConversion(TypedDict):
+    source: str  # The file path, or "<buffer n>" for in-memory files
+    nodes: List[AlNode]  # Empty when the conversion failed
+    error: Optional[str]
+
+
+class AlCourseDocument(TypedDict):
+    nodes: List[AlNode]
+    course_number: str  # The first paragraph of the document (the course rubric and number)
+    course_title: str  # The second paragraph of the document
+
+
+class AlConversionState(TypedDict):
+    converter_version: str
+    sections: Dict[str, str]  # Section fingerprint -> rendered section text
+    tables: Dict[str, str]  # Table fingerprint -> rendered table text
+    nodes: List[AlNode]
+
+
+class AlReconversion(TypedDict):
+    nodes: List[AlNode]
+    state: AlConversionState  # To pass as previous state on the next upload
+    changed: List[int]  # node_numbers that are new or whose text changed
+    renumbered: Dict[int, int]  # Previous node_number to new node_number of the unchanged nodes that moved
+    removed: List[int]  # node_numbers of the previous conversion that no longer exist
+
+
+class AlStageMetrics(TypedDict):
+    stage: str  # Name of the conversion function
+    seconds: float
+    allocated_bytes: Optional[int]  # Net memory allocated by the stage, None unless tracemalloc is tracing
+    input_size: int  # See convert_file for what each stage counts
+    output_size: int
+
+
+class AlTableTemplate(TypedDict, total=False):
+    title: str  # Title of the tables rendered with this template, also the title of the node
+    match: Literal["exact", "contains"]  # How the table title is compared, "exact" by default
+    include_header: bool  # Whether the first row is rendered like the others (a table without header), False by default
+    intro: str  # Text after the node title, before the rows
+    # Rendered for every row, in order. A part is a str.format template where {0}, {1}... are the cells of the row,
+    # or a condition {"if_empty": column, "then": template, "else": template}
+    # or {"if_contains": [column, text], "then": template, "else": template}
+    row: List[Union[str, Dict[str, Any]]]
+
+
+class AlAnswer(TypedDict):
+    query: str  # The pre-processed query
+    relevance_score: Optional[float]  # Rerank score of the prompt context
+    index: Optional[int]  # Index of the node used as prompt context
+    prompt_context: Optional[str]
+    answer: Optional[str]
+    error: Optional[str]  # None when the query was answered, otherwise the stage and the error
+
+
+class AlEvaluationRecord(AlAnswer):
+    position: int  # Row of the question in the question bank
+    question: str  # The question as written in the question bank
+
+
+class AlCompletionMetrics(TypedDict):
+    deployment: str
+    streamed: bool
+    seconds_to_first_token: Optional[float]  # None when the completion has no content
+    seconds: float  # Until the last token
+    chunks: int  # Streamed chunks with content, 1 for a completion that is not streamed
+    prompt_tokens: Optional[int]  # From the usage of the response, None when the provider did not send it
+    completion_tokens: Optional[int]  # From the usage of the response, None when the provider did not send it
+
+
+class AlEvent(TypedDict):
+    date: str  # ISO date (YYYY-MM-DD), sorts chronologically
+    kind: Literal["assignment", "lecture"]
+    title: str  # The assignment or the topic of the lecture
+    detail: str  # The worth of the assignment or the readings of the lecture
+    date_text: str  # The date as written in the table
+
+
+class AlQueryIntent(NamedTuple):
+    subject: Literal["assignment", "lecture"]  # "assignment" when the query names one, "lecture" (class content) otherwise
+    relation: Optional[Literal["next", "previous", "first", "last", "today"]]  # None when the query is not temporal
+
+
+class AlRoutedQuery(NamedTuple):
+    query: str  # The normalized query
+    intent: AlQueryIntent
@@ -0,0 +1,150 @@
+import argparse
+import io
+import json
+import os
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple, Union
+
+from al_types import AlConversion, AlNode
+from conversions import convert_file
+
+PathOrBuffer = Union[str, os.PathLike, bytes, io.BytesIO]
+
+
+def prepare_source(path_or_buffer: PathOrBuffer, position: int) -> Tuple[str, Union[str, bytes]]:
+    """
+    Prepares a file given as a path or an in-memory buffer to be sent to a worker process. A path is sent as it is and
+    the worker reads the file, so that the files of a large batch are not all held in memory by this process at once
+
+    :param path_or_buffer: File path, bytes or io.BytesIO buffer
+    :param position: Position of the file in the batch, used to name buffers
+    :return: The source name, and the path or the file bytes
+
+    """
+
+    if isinstance(path_or_buffer, io.BytesIO):
+        return f"<buffer {position}>", path_or_buffer.getvalue()
+
+    if isinstance(path_or_buffer, bytes):
+        return f"<buffer {position}>", path_or_buffer
+
+    return os.fspath(path_or_buffer), os.fspath(path_or_buffer)
+
+
+def convert_source(path_or_bytes: Union[str, bytes]) -> List[AlNode]:
+    """
+    Worker entry point, reads a docx file if given its path and converts it to nodes
+
+    :param path_or_bytes: The docx file path or bytes
+    :return: Converted nodes
+
+    """
+
+    if isinstance(path_or_bytes, str):
+        with open(path_or_bytes, "rb") as docx_file:
+            path_or_bytes = docx_file.read()
+
+    return convert_file(io.BytesIO(path_or_bytes))
+
+
+def write_jsonl(conversion: AlConversion, output: TextIO) -> None:
+    """
+    Writes the nodes of a conversion as JSON lines, each node metadata gets the source of the file
+
+    :param conversion: A converted file
+    :param output: The text stream to write to
+
+    """
+
+    for node in conversion["nodes"]:
+        output.write(json.dumps({**node, "metadata": {**node["metadata"], "source": conversion["source"]}}) + "\n")
+
+    output.flush()
+
+
+def convert_files(
+        paths_or_buffers: Sequence[PathOrBuffer],
+        workers: Optional[int] = None,
+        output: Optional[TextIO] = None
+) -> List[AlConversion]:
+    """
+    Converts many docx files in a process pool.
+    A file that fails to convert gets its error in the result and does not abort the batch.
+
+    :param paths_or_buffers: File paths, bytes or io.BytesIO buffers
+    :param workers: Number of worker processes, defaults to the number of CPUs. With 1, files are converted in this process
+    :param output: Optional text stream where the nodes are written as JSON lines as soon as each file is converted
+    :return: One conversion per file, in input order
+
+    """
+
+    conversions: List[Optional[AlConversion]] = [None] * len(paths_or_buffers)
+
+    def finish(position: int, source: str, nodes: List[AlNode], error: Optional[str]) -> None:
+        conversions[position] = {"source": source, "nodes": nodes, "error": error}
+
+        if output is not None and error is None:
+            write_jsonl(conversions[position], output)
+
+    if workers == 1:
+        for position, path_or_buffer in enumerate(paths_or_buffers):
+            source, path_or_bytes = prepare_source(path_or_buffer, position)
+
+            try:
+                finish(position, source, convert_source(path_or_bytes), None)
+            except Exception as e:
+                finish(position, source, [], f"{type(e).__name__}: {e}")
+
+        return conversions
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures: Dict[Future, Tuple[int, str]] = {}
+
+        for position, path_or_buffer in enumerate(paths_or_buffers):
+            source, path_or_bytes = prepare_source(path_or_buffer, position)
+            futures[executor.submit(convert_source, path_or_bytes)] = (position, source)
+
+        # A file that cannot be read fails in its worker, like a file that cannot be converted.
+        # Results are written as they arrive, but kept in input order
+        for future in as_completed(futures):
+            position, source = futures[future]
+            try:
+                finish(position, source, future.result(), None)
+            except Exception as e:
+                finish(position, source, [], f"{type(e).__name__}: {e}")
+
+    return conversions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert a directory of docx syllabi to Al nodes (JSON lines).")
+    parser.add_argument("directory", help="Directory containing the .docx files")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: standard output)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    # Word lock files (~$name.docx) are not documents
+    paths = sorted(
+        os.path.join(args.directory, name) for name in os.listdir(args.directory)
+        if name.lower().endswith(".docx") and not name.startswith("~$")
+    )
+
+    output: TextIO = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        conversions = convert_files(paths, workers=args.workers, output=output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    failed = [conversion for conversion in conversions if conversion["error"] is not None]
+    for conversion in failed:
+        print(f"{conversion['source']}: {conversion['error']}", file=sys.stderr)
+
+    print(f"Converted {len(conversions) - len(failed)} of {len(conversions)} files", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import heapq
+import math
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Words too common in syllabi and questions to help ranking
+STOP_WORDS = frozenset(
+    "a an and are as at be by can course do does for from has have how i in is it its me my of on or our the "
+    "this to was we what when where which who will with you your".split()
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+URL_PATTERN = re.compile(r"\(https?://[^)\s]*\)|https?://\S+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenize a node text or a query for BM25.
+    URLs are dropped, words are lowercased, stop words removed and plurals folded ("readings" -> "reading").
+    Numbers, course codes ("1740") and times ("4:30" -> "4", "30") are kept.
+
+    :param text: The text
+    :return: The terms
+
+    """
+
+    terms = []
+
+    for token in TOKEN_PATTERN.findall(URL_PATTERN.sub(" ", text.lower())):
+        token = token.replace("'s", "").replace("'", "")
+
+        if not token or token in STOP_WORDS:
+            continue
+
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss") and not token.isdigit():
+            token = token[:-1]
+
+        terms.append(token)
+
+    return terms
+
+
+def node_text(node: Any) -> str:
+    return node["text"] if isinstance(node, dict) else node
+
+
+class Bm25Index:
+    """
+    Inverted index over the nodes of a course with BM25 scoring, used to shortlist nodes before the remote rerank
+
+    """
+
+    def __init__(self, nodes: Sequence[Any], k1: float = 1.5, b: float = 0.75):
+        """
+        :param nodes: Nodes texts or AlNode dictionaries, the index of a node in this list is its id in the results
+        :param k1: BM25 term frequency saturation
+        :param b: BM25 length normalization
+
+        """
+
+        self.k1 = k1
+        self.b = b
+        self.size = len(nodes)
+
+        # Term -> list of (node index, term frequency)
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+
+        for index, node in enumerate(nodes):
+            terms = tokenize(node_text(node))
+            self.lengths.append(len(terms))
+
+            frequencies: Dict[str, int] = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, []).append((index, frequency))
+
+        self.average_length = sum(self.lengths) / self.size if self.size else 0.0
+
+        # Computed once, a term's idf does not depend on the query
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+        self._length_norms = [
+            self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            for length in self.lengths
+        ]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        The nodes with the best BM25 score for a query
+
+        :param query: The query
+        :param k: Number of results
+        :return: Up to k (node index, score), best first. Nodes without any query term are not returned
+
+        """
+
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+
+            for index, frequency in self.postings[term]:
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self._length_norms[index])
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def shortlist(self, query: str, k: int = 10) -> List[int]:
+        """
+        Indices of the k nodes to send to the reranker: the best BM25 matches, then the other nodes in order to fill k
+
+        :param query: The query
+        :param k: Number of nodes
+        :return: Node indices
+
+        """
+
+        selected = [index for index, _ in self.search(query, k)]
+
+        if len(selected) < k:
+            chosen = set(selected)
+            selected += [index for index in range(self.size) if index not in chosen][:k - len(selected)]
+
+        return selected
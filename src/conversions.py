@@ -1,435 +1,337 @@
+import hashlib
 import io
+import json
 import re
-from typing import List, Any, Tuple, Optional
+from typing import List, Any, Tuple, Optional, Dict, Sequence, Iterator
 
-import mammoth
-import pandas as pd
-from bs4 import BeautifulSoup
-from docx import Document
-from docx.text.paragraph import Paragraph
+from al_types import AlEvent, AlNode, AlDocument, AlParagraph, AlTable, AlTextTable
+from metrics import StageObserver, measure_stage
+from node_cache import NodeCache, cache_key
+from table_templates import DEFAULT_TEMPLATES, ROW_SEPARATOR, TableTemplates
+from timeline import read_events
 
-from al_types import AlNode
+# Bump when a change to the conversion changes the nodes, so that cached conversions are not reused
+CONVERTER_VERSION = "9"
 
+# Token budget of a node, the nodes over it are split into chunks (see chunk_node). None keeps every node whole
+CHUNK_TOKENS: Optional[int] = 512
 
-def find_h_level(docx_file: Document) -> List[str]:
+# Words and punctuation marks, about one token each in the English text of a syllabus
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Where a node is split, by preference: before a table row (or a table combined into the node), before a line (a
+# paragraph, or a line of a row), after a sentence, after a word
+CHUNK_BOUNDARIES = (
+    re.compile("(?=" + ROW_SEPARATOR + ")|(?<=\n)(?=\\*)"),
+    re.compile(r"(?=\n)"),
+    re.compile(r"(?<=[.!?])(?=\s)"),
+    re.compile(r"(?<=\S)(?=\s)"),
+)
+
+
+def read_document(file_bytes: io.BytesIO) -> AlDocument:
+    """
+    Parse a docx file into the block model. python-docx is imported on first use, so importing this module stays fast.
+
+    :param file_bytes: File in io.BytesIO buffer
+    :return: The document blocks
+
+    """
+
+    from docx_blocks import read_document as read_docx_blocks
+
+    return read_docx_blocks(file_bytes)
+
+
+def find_h_level(document: AlDocument) -> List[str]:
     headings: List[str] = []
 
-    for paragraph in docx_file.paragraphs:
+    for paragraph in document.paragraphs:
 
-        if paragraph.style.name.startswith('Heading'):
+        if paragraph.is_heading:
             headings.append(paragraph.text.strip())
 
     # Iterating item through headings, if item is true (i.e. not empty) add item in the list
     return [item for item in headings if item]
 
 
-def find_sections_paragraphs(sections: List[str], docx_file: Document) -> List[int]:
+def find_sections_paragraphs(sections: List[str], document: AlDocument) -> List[int]:
     """
-    Finds the paragraph of the sections defined in the list sections, returns their indices or something?
+    Finds the heading paragraph of each section defined in the list sections and returns their indices.
+    When several headings have the same text, the n-th occurrence of the section gets the n-th heading.
 
     :param sections: List of sections
-    :param docx_file: The docx file
+    :param document: The parsed document
     :return: List of paragraph indices
 
     """
 
+    # Heading text -> indices of the heading paragraphs with that text, in document order
+    heading_paragraphs: Dict[str, List[int]] = {}
+
+    for index, paragraph in enumerate(document.paragraphs):
+
+        if paragraph.is_heading:
+            heading_paragraphs.setdefault(paragraph.text.strip(), []).append(index)
+
     section_paragraphs: List[int] = []
+    occurrences: Dict[str, int] = {}
+
+    for section in sections:
+        indices = heading_paragraphs.get(section, [])
+        occurrence = occurrences.get(section, 0)
 
-    for i in range(len(sections)):
-        for j in range(len(docx_file.paragraphs)):
-            # If the section in the list is the same as the doc paragraph, add the paragraph number to section_paragraph list
-            if sections[i] == docx_file.paragraphs[j].text.strip():
-                section_paragraphs.append(j)
+        # A section with no (remaining) heading of the same text is skipped
+        if occurrence < len(indices):
+            section_paragraphs.append(indices[occurrence])
+            occurrences[section] = occurrence + 1
 
     return section_paragraphs
 
 
+def render_section(paragraphs: Sequence[AlParagraph], start: int, end: int, title: str, is_last: bool) -> str:
+    """
+    Render the paragraphs of one section as a node text
+
+    :param paragraphs: The paragraphs of the document
+    :param start: Index of the heading paragraph of the section
+    :param end: Index of the heading paragraph of the next section (or the number of paragraphs)
+    :param title: The section title
+    :param is_last: Whether this is the last section of the document
+    :return: Node text
+
+    """
+
+    # The paragraph texts with their hyperlinks in markdown format
+    if is_last:
+        # The paragraphs of the last section are not separated
+        return "*" + title + "*\n" + "".join(render_hyperlinks(paragraphs[j]).strip() for j in range(start + 1, end))
+
+    return "*" + title + "*\n" + "".join(render_hyperlinks(paragraphs[j]).strip() + " " for j in range(start + 1, end)) + "\n"
+
+
+def add_course_information(nodes_text: List[str], paragraphs: Sequence[AlParagraph]) -> None:
+    """
+    Add the course title, rubric and number, which are not in Course Information, but in the title
+
+    :param nodes_text: The nodes texts, the first one is the Course Information section
+    :param paragraphs: The paragraphs of the document
+
+    """
+
+    if "Course Information" in nodes_text[0]:  # The following code does not apply with Questions.docx
+        nodes_text[0] = nodes_text[0] + "The course rubric and number is " + paragraphs[0].text.strip() + ".\n"
+        nodes_text[0] = nodes_text[0] + "The course title is " + paragraphs[1].text.strip() + "."
+
+
 def convert_doc_to_nodes(
         section_paragraphs: List[int],
-        docx_file: Document,
+        document: AlDocument,
         sections: List[str]
 ) -> List[str]:
     """
     Convert the docx to nodes
 
     :param section_paragraphs: Paragraph indices
-    :param docx_file: Document
+    :param document: The parsed document
     :param sections: Sections
     :return: List of nodes texts
 
     """
 
+    paragraphs = document.paragraphs
     nodes_text: List[str] = []
-    nodes_temp: str = ""
 
     for i in range(len(section_paragraphs) - 1):
-        for j in range(section_paragraphs[i] + 1, section_paragraphs[i + 1]):
+        nodes_text.append(render_section(paragraphs, section_paragraphs[i], section_paragraphs[i + 1], sections[i], False))
 
-            # First check if there's a hyperlink in the paragraph
-            hyperlink_text, hyperlink_url = include_hyperlink(docx_file.paragraphs[j])
+    # The last section goes from its heading to the last paragraph of the document
+    last_section = section_paragraphs[-1]
+    nodes_text.append(render_section(paragraphs, last_section, len(paragraphs), paragraphs[last_section].text.strip(), True))
 
-            # Loop to grab all items in hyperlink_text[] and hyperlink_url[]
-            for k in range(len(hyperlink_text)):
+    add_course_information(nodes_text, paragraphs)
 
-                # If there's no item in hypertext_link or hypertext_url, you get an error message
-                if not len(hyperlink_text) > 0:
-                    continue
+    return nodes_text
 
-                # Follows the markdown format
-                temp_text = docx_file.paragraphs[j].text.replace(hyperlink_text[k], "[" + hyperlink_text[k] + "](" + hyperlink_url[k] + ")")
-                docx_file.paragraphs[j].text = temp_text
 
-            nodes_temp = nodes_temp + docx_file.paragraphs[j].text.strip() + " "
+def table_to_rows(table: AlTable) -> AlTextTable:
+    """
+    Convert a parsed table to rows of cell texts, cells with a link become "[text] (link)".
+    Short rows are padded with empty cells to the width of the widest row.
 
-        nodes_text.append("*" + sections[i] + "*\n" + nodes_temp + "\n")
-        nodes_temp = ""
+    :param table: The parsed table
+    :return: The header row and the other rows
 
-    # Need to add the following code to capture the paragraphs in the last section, which are not captured in the loop because the loop would be out of range
-    for i in range(section_paragraphs[len(section_paragraphs) - 1], len(docx_file.paragraphs)):  # from the last section position to the last paragraph of the document
+    """
 
-        if i == section_paragraphs[len(section_paragraphs) - 1]:
-            nodes_temp = nodes_temp + "*" + docx_file.paragraphs[i].text.strip() + "*\n"
-            continue
+    width = max((len(row) for row in table.rows), default=0)
+    rows = tuple(
+        tuple(f'[{cell.text}] ({cell.url})' if cell.url else cell.text for cell in row) + ("",) * (width - len(row))
+        for row in table.rows
+    )
 
-        # first check if there's a hyperlink in the paragraph
-        hyperlink_text, hyperlink_url = include_hyperlink(docx_file.paragraphs[i])
+    return AlTextTable(table.title, rows[0] if rows else (), rows[1:])
 
-        # Loop to grab all items in hyperlink_text[] and hyperlink_url[]
-        for k in range(len(hyperlink_text)):
 
-            # If there's no item in hypertext_link or hypertext_url, you get an error message
-            if not len(hyperlink_text) > 0:
-                continue
+def read_tables(document: AlDocument) -> Tuple[List[AlTextTable], List[str]]:
+    """
+    Collect the tables that have a heading directly above them, which is the name of the table
 
-            temp_text = docx_file.paragraphs[i].text.replace(hyperlink_text[k], "[" + hyperlink_text[k] + "](" + hyperlink_url[k] + ")")
-            docx_file.paragraphs[i].text = temp_text
+    :param document: The parsed document
+    :return: The tables as rows of cell texts and their titles
 
-        nodes_temp = nodes_temp + docx_file.paragraphs[i].text.strip()
+    """
 
-    nodes_text.append(nodes_temp)
+    titled_tables = [table for table in document.tables if table.title is not None]
 
-    # Add the course title, rubric and number, which are not in Course Information, but in the title
-    if "Course Information" in nodes_text[0]:  # The following code does not apply with Questions.docx
-        nodes_text[0] = nodes_text[0] + "The course rubric and number is " + docx_file.paragraphs[0].text.strip() + ".\n"
-        nodes_text[0] = nodes_text[0] + "The course title is " + docx_file.paragraphs[1].text.strip() + "."
+    doc_tables = [table_to_rows(table) for table in titled_tables]
+    table_titles = [table.title for table in titled_tables]
 
-    return nodes_text
+    return doc_tables, table_titles
 
 
-def read_tables_bs4mp(html_text: str) -> List[pd.DataFrame]:
+def render_tables_add_to_nodes_text(
+        table_titles: List[str],
+        nodes_text: List[str],
+        doc_tables: List[AlTextTable],
+        templates: Optional[TableTemplates] = None
+) -> List[str]:
     """
-    Parse the HTML tables with BeautifulSoup
+    Render the tables with the template registered for their title and add them to the nodes texts
 
-    :param html_text: The HTML text
-    :return: Pandas DFs representing tables
+    :param table_titles: The table titles
+    :param nodes_text: The nodes texts, the rendered tables are appended to it
+    :param doc_tables: The tables
+    :param templates: The table templates, the built-in ones by default
+    :return: The nodes texts
 
     """
 
-    # Parse the HTML with BeautifulSoup
-    soup = BeautifulSoup(html_text, 'html.parser')
+    templates = templates if templates is not None else DEFAULT_TEMPLATES
 
-    # Find all tables
-    tables = soup.find_all('table')
+    for title, table in zip(table_titles, doc_tables):
+        nodes_text.append(templates.render(table._replace(title=title)))
 
-    data_frames = []
-    for table in tables:
-        # Find all rows
-        rows = table.find_all('tr')
+    return nodes_text
 
-        table_data = []
-        for row in rows:
-            cols = row.find_all('td')
-
-            # Extract text and links
-            cols_text = [col.get_text() for col in cols]
-            cols_links = [col.find('a')['href'] if col.find('a') and 'href' in col.find('a').attrs else '' for col in cols]
 
-            # Combine text and links
-            cols_with_links = [f'[{text}] ({link})' if link else text for text, link in zip(cols_text, cols_links)]
+def render_table(table: AlTable, templates: Optional[TableTemplates] = None) -> str:
+    """
+    Render one titled table as a node text
 
-            table_data.append(cols_with_links)
+    :param table: The parsed table
+    :param templates: The table templates, the built-in ones by default
+    :return: Node text
 
-        # Convert table data to DataFrame
-        data_frames.append(pd.DataFrame(table_data))
-
-    return data_frames
-
-
-def read_tables(html_text, sections):
-    # With the following two code lines, pd.read_html did not keep the links. So I used beautiful soup instead
-    # html_buffer = StringIO(html_text)  # Had to wrap the HTML string in a StringIO object because a direct pd.read (see line below) will be deprecated
-    # doc_tables_df = pd.read_html(html_buffer)  # This grabs all the tables in the syllabus and stores them in a dataframe
-    doc_tables_df = read_tables_bs4mp(html_text)
+    """
 
-    # find all caption
-    # pattern = r"</table>(.*?)</p>"  # All captions are right after the table between <p> and </p>
-    # matches = re.findall(pattern, html_text)
-    # table_titles = []
-    # for i in range(len(matches)):
-    #     if matches[i][5].isdigit():
-    #         table_titles.append(matches[i][5:])  # Create table title without the initial 2 digits
-    #     else:
-    #         table_titles.append(matches[i][4:])
+    return render_tables_add_to_nodes_text([table.title], [], [table_to_rows(table)], templates)[0]
 
-    # find name of table, which is the heading above it (h1, h2 or h3
-    longest_section_len = len(max(sections, key=len))  # first determine the length of the longest section
-    pattern_close = r"</h\d>\s*<table>"  # Finds all h1 or h2 or h3 followed by a table
-    closing_indexes = [m.start() for m in re.finditer(pattern_close, html_text)]  # Finds the closing index of the table
 
-    previous_index = []  # this goes back to the index at a distance of the longest section
-    for closing_index in closing_indexes:
-        previous_index.append(closing_index - longest_section_len)
-    chunks = []  # chunks contain the titles but addtional crap beforehand
-
-    for i in range(len(closing_indexes)):
-        chunks.append(html_text[previous_index[i]:closing_indexes[i] + 12])
-    almost_titles = []  # an almost title still needs to be cleaned further to get the title
-    for item in chunks:
-        match = re.search(r"<h\d>.*</h", item)
-        if match:
-            almost_titles.append(match.group())
-    # Clean the almost titles to have real titles
-    table_titles = []
-    for i in range(len(almost_titles)):  # Removes the initial tag and the ending tag
-        table_titles.append(almost_titles[i][4:-3])
-
-    for i in range(
-            len(table_titles)):  # this part is to find occurrence of another heading in the title (one that should be eliminated)
-        if "</h" in table_titles[i]:
-            temp_index = table_titles[i].find("</h") + 9
-            table_titles[i] = table_titles[i][temp_index:]
-    return doc_tables_df, table_titles
+def converter_version(
+        templates: Optional[TableTemplates] = None,
+        chunk_tokens: Optional[int] = CHUNK_TOKENS,
+        labels: Optional["LabelRewriter"] = None
+) -> str:
+    """
+    Version of the conversion, which includes the table templates and the Course Information labels when they are not
+    the built-in ones and the token budget of the nodes when it is not CHUNK_TOKENS
 
+    :param templates: The table templates
+    :param chunk_tokens: The token budget of the nodes
+    :param labels: The label rewriter of the Course Information section
+    :return: Version string
 
-def render_tables_add_to_nodes_text(table_titles, nodes_text, doc_table_df):
-    for idx, title in enumerate(table_titles):
-        temp_df: pd.DataFrame = (doc_table_df[idx])
+    """
 
-        if title == "Tutorials":
-            temp_text = "*Tutorials*\n "
+    version = CONVERTER_VERSION if templates is None else CONVERTER_VERSION + "+" + templates.fingerprint
 
-            temp_text += (
-                "Who your TA is and what your TA's email is, and what your tutorial time and day, "
-                "your tutorial room, and your tutorial Zoom address are depends on which tutorial "
-                "your are in. If the tutorial information is not provided, please always provide "
-                "a conditional answer that includes all possibilities. Example of a proper answer: "
-                "'if you are in Tutorial 1, your TA is...; if you are in Tutorial 2, your TA is...; "
-                "if you are in Tutorial 3, your TA is...'. \n "
-            )
-
-            for j in range(1, len(temp_df)):
-                temp_text += (
-                        "If you are in Tutorial " + temp_df.iloc[j, 0] +
-                        ", your TA (or teaching assistant or tutor or responsible instructor who teaches the tutorial) is " +
-                        temp_df.iloc[j, 1] + ".\n "
-                )
-
-                temp_text += (
-                        "If you are in Tutorial " +
-                        temp_df.iloc[j, 0] + ", your tutorial time is " +
-                        temp_df.iloc[j, 2] + ".\n "
-                )
-
-                temp_text += (
-                        "If you are in Tutorial " +
-                        temp_df.iloc[j, 0] + ", your tutorial room is " +
-                        temp_df.iloc[j, 3] + ".\n "
-                )
-
-                temp_text += (
-                        "If you are in Tutorial " +
-                        temp_df.iloc[j, 0] + ", your Zoom address (or Zoom link) during online sessions is " +
-                        temp_df.iloc[j, 4] + " .\n"
-                )
-
-            nodes_text.append(temp_text)
-
-        elif "Faculty Members Information" in title:
-            temp_text = "*Faculty Members Information*\n "
-
-            for j in range(1, len(temp_df)):
-                temp_text += (
-                        temp_df.iloc[j, 0] + " is the course's " + temp_df.iloc[j, 1] + " and has the following email address: " +
-                        temp_df.iloc[j, 2] + " and has the following office hours (time you can meet or appointment time): " +
-                        temp_df.iloc[j, 3] + " and has the following office address or location (where you can meet with your professor or instructor or teacher or TA): " + \
-                        temp_df.iloc[j, 4] + ".\n "
-                )
-
-            nodes_text.append(temp_text)
-
-        elif title == "Summary of Evaluation":
-
-            temp_text = "*Summary of Evaluation*\n "
-
-            temp_text += (
-                "This section answers questions about how much an assignment is worth (how much it counts toward the final grade) "
-                "and when the assignments are due or have to be submitted or handed in (submission date). \n"
-            )
-
-            # evaluation_table_index = i
-            # ^ This is to be able to find the evaluation table when we do the query preprocessing for temporal relations
-
-            for j in range(1, len(temp_df)):
-                temp_text += (
-                        "The " + temp_df.iloc[j, 0] + " is worth " +
-                        temp_df.iloc[j, 1] + " of the final grade. In other words, it counts for "
-                        + temp_df.iloc[j, 1] + " of the final grade.\n "
-                )
-
-                temp_text += (
-                        "The " + temp_df.iloc[j, 0] + " is due on " +
-                        temp_df.iloc[j, 2] + ". In other words, the deadline or due date or submission date for "
-                        + temp_df.iloc[j, 0] + " is " + temp_df.iloc[j, 2] + ".\n "
-                )
-
-            nodes_text.append(temp_text)
-
-        elif title == "Grading Equivalence":
-            temp_text = "*Grading Equivalence*\n "
-
-            for j in range(1, len(temp_df)):
-                temp_text += (
-                        temp_df.iloc[j, 0] + " is the same as a grade point of " +
-                        temp_df.iloc[j, 1] + ", which falls in the percent range of " + temp_df.iloc[j, 2] +
-                        "%, and is described as '" + temp_df.iloc[j, 3] + "'.\n "
-                )
-
-            nodes_text.append(temp_text)
-
-        elif title == "Definitions of Standing":
+    if labels is not None:
+        version += "+labels=" + labels.fingerprint
 
-            temp_text = "*Definitions of Standing*\n "
+    return version if chunk_tokens == CHUNK_TOKENS else version + "+tokens=" + str(chunk_tokens)
 
-            for j in range(0, len(temp_df)):
-                temp_text += (
-                        "A grade considered '" + temp_df.iloc[j, 0] +
-                        "' means that you have a " + temp_df.iloc[j, 1] + "\n "
-                )
-
-            nodes_text.append(temp_text)
-
-        elif title == "Schedule and Readings":
-            temp_text = "*Schedule and Readings*\n "
-
-            for j in range(1, len(temp_df)):
-                temp_text += (
-                        "The topic on " + temp_df.iloc[j, 2] +
-                        " is (or is about) '" + temp_df.iloc[j, 0] + "'. In other words, '" + temp_df.iloc[j, 0] +
-                        "' is presented in class on " + temp_df.iloc[j, 2] + ".\n "
-                )
 
-                if str(temp_df.iloc[j, 1]) == "nan":
-                    temp_text += "There are no readings on " + temp_df.iloc[j, 2] + ".\n "
+# Labels of the Course Information section and the sentences that replace them
+COURSE_INFORMATION_LABELS: Dict[str, str] = {
+    "Course Director:": "The course director (or professor or instructor or teacher) for this course is ",
+    "Email:": "\n Your course director's email is ",
+    "Semester:": "\n The current semester (or term) is ",
+    "Lecture time & day:": "\n The lecture (or class) is offered on the following day and time: ",
+    "Lecture room:": (
+        "\n If you're wondering how to get to your lecture, the lecture (or class) takes place in the following classroom (or location): "
+    ),
+    "Zoom (Lecture):": (
+        "\n Some classes may be offered on Zoom or you may have to attend some classes on Zoom only during unforeseen "
+        "situations such as snowstorms or the instructor's illness, in which case the Zoom link (or Zoom address) for the lecture will be "
+    ),
+    "eClass:": "\n There is an eClass site (the course has been uploaded to eClass) and the eClass link (or address or URL) is ",
+    "Office Hours:": "\n The course director's (or professor's or instructor's or teacher's) office hours are ",
+    "\t": "",
+}
+
+
+class LabelRewriter:
+    """
+    Replaces every label of a label -> sentence table in one pass over the text
 
-                else:
-                    temp_text += (
-                            "The reading(s) for the topic called '" + temp_df.iloc[j, 0] + "' on " +
-                            temp_df.iloc[j, 2] + " is (are) the following: " + str(temp_df.iloc[j, 1]) + "\n "
-                    )
+    """
 
-            nodes_text.append(temp_text)
+    def __init__(self, labels: Dict[str, str]):
+        self.labels = dict(labels)
 
-        elif title == "Important Dates":
-            temp_text = "*Important Dates*\n "
+        # Longer labels first, so that a label wins over the labels it starts with
+        self.pattern = re.compile("|".join(re.escape(label) for label in sorted(self.labels, key=len, reverse=True)))
+        self.fingerprint = hashlib.sha256(json.dumps(self.labels, sort_keys=True).encode("utf-8")).hexdigest()[:16]
 
-            for j in range(1, len(temp_df)):
-                if "None" in temp_df.iloc[j, 1]:
-                    temp_text += "There is no " + temp_df.iloc[j, 0] + ".\n "
-                else:
-                    temp_text += temp_df.iloc[j, 0] + " is on " + temp_df.iloc[j, 1] + ".\n "
+    def __call__(self, text: str) -> str:
+        if not self.labels:
+            return text
 
-            nodes_text.append(temp_text)
+        return self.pattern.sub(lambda match: self.labels[match.group()], text)
 
-        else:
-            temp_text = "*" + title + "*\n "
-            nb_rows = len(temp_df)
-            nb_columns = len(temp_df.columns)
 
-            for j in range(1, nb_rows):
+DEFAULT_LABELS = LabelRewriter(COURSE_INFORMATION_LABELS)
 
-                temp_text += (
-                        "The following " + temp_df.iloc[0, 0].lower() + ": " +
-                        temp_df.iloc[j, 0] + " has "
-                )
 
-                for k in range(1, nb_columns - 1):
-                    temp_text += (
-                            "the following " + temp_df.iloc[0, k].lower() + ": " +
-                            str(temp_df.iloc[j, k]) + " and has "
-                    )
+def rewrite_course_information(text: str, labels: Optional[LabelRewriter] = None) -> str:
+    """
+    Render the section Course Information, its labels become sentences
 
-                    temp_text += (
-                            "the following " + temp_df.iloc[0, k + 1].lower() + ": "
-                            + str(temp_df.iloc[j, k + 1]).strip() + "."
-                    )
+    :param text: The Course Information node text
+    :param labels: The label rewriter, COURSE_INFORMATION_LABELS by default
+    :return: The rendered text
 
-            nodes_text.append(temp_text)
+    """
 
-    return nodes_text
+    return (labels if labels is not None else DEFAULT_LABELS)(text)
 
 
-def clean_up(nodes_text: List[str]) -> List[str]:
+def node_title(text: str) -> str:
     """
-    Render the section Course Information
+    The title of a node, which is everything up to the second *
 
-    :param nodes_text:
-    :return:
+    :param text: Node text
+    :return: "*Title" (without the closing *)
 
     """
 
-    nodes_text[0] = nodes_text[0].replace(
-        "Course Director:",
-        "The course director (or professor or instructor or teacher) for this course is "
-    )
+    second_index = text.find("*", text.find("*") + 1)
 
-    nodes_text[0] = nodes_text[0].replace(
-        "Email:",
-        "\n Your course director's email is "
+    return text[:second_index] if second_index != -1 else text
 
-    )
 
-    nodes_text[0] = nodes_text[0].replace(
-        "Semester:",
-        "\n The current semester (or term) is "
-    )
-
-    nodes_text[0] = nodes_text[0].replace(
-        "Lecture time & day:",
-        "\n The lecture (or class) is offered on the following day and time: "
-    )
-
-    nodes_text[0] = nodes_text[0].replace(
-        "Lecture room:",
-        "\n If you're wondering how to get to your lecture, the lecture (or class) takes place in the following classroom (or location): "
-    )
-
-    nodes_text[0] = nodes_text[0].replace(
-        "Zoom (Lecture):",
-        (
-            "\n Some classes may be offered on Zoom or you may have to attend some classes on Zoom only during unforeseen "
-            "situations such as snowstorms or the instructor's illness, in which case the Zoom link (or Zoom address) for the lecture will be "
-        )
-    )
-
-    nodes_text[0] = nodes_text[0].replace(
-        "eClass:",
-        "\n There is an eClass site (the course has been uploaded to eClass) and the eClass link (or address or URL) is "
+def clean_up(nodes_text: List[str], labels: Optional[LabelRewriter] = None) -> List[str]:
+    """
+    Render the section Course Information, combine the nodes that have the same title and sort them
 
-    )
-    temp_text = nodes_text[0].replace(
-        "Office:",
-        "\n What is the course director's (or professor's or instructor's or teacher's) office number (or office address)? Where can I meet him or her? The answer is: "
-    )
+    :param nodes_text: The nodes texts, the first one is the Course Information section
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: The sorted nodes texts
 
-    nodes_text[0] = nodes_text[0].replace(
-        "Office Hours:",
-        "\n The course director's (or professor's or instructor's or teacher's) office hours are "
-    )
+    """
 
-    nodes_text[0] = nodes_text[0].replace(
-        "\t",
-        ""
-    )
+    nodes_text[0] = rewrite_course_information(nodes_text[0], labels)
 
     # Combine "Tutorials" and "Faculty Members Information" for better results
     tutorials_index: Optional[int] = None
@@ -447,51 +349,20 @@ def clean_up(nodes_text: List[str]) -> List[str]:
         nodes_text[tutorials_index] += nodes_text[faculty_members_index]
         del nodes_text[faculty_members_index]
 
-    # Erase empty nodes
-    nodes_text = [
-        text for text in nodes_text
-        if not (text.endswith("*\n\n") or text.endswith("*\n \n"))
-    ]
+    # Erase empty nodes, then combine the nodes that have the same title (e.g. a table and the text under the same header)
+    groups: Dict[str, List[str]] = {}
+
+    for text in nodes_text:
+        if not (text.endswith("*\n\n") or text.endswith("*\n \n")):
+            groups.setdefault(node_title(text), []).append(text)
 
-    # Combine two nodes when there is a table and text under the same header
-    # If you sort the list, like item will be next to each other
-    sorted_nodes_text = sorted(nodes_text)
-
-    for i in range(len(nodes_text) - 2, -1, -1):
-        first_index = sorted_nodes_text[i].find("*")
-
-        # Starts searching after the first *
-        second_index = sorted_nodes_text[i].find("*", first_index + 1)
-
-        # You now have the title of the node
-        temp_node = sorted_nodes_text[i][:second_index]
-
-        if temp_node == sorted_nodes_text[i + 1][:second_index]:
-            # Combine the following item with the previous
-            sorted_nodes_text[i] = sorted_nodes_text[i] + sorted_nodes_text[i + 1][second_index + 1:]
-            # And delete the following, now redundant
-            del sorted_nodes_text[i + 1]
-
-            # From here on (i.e. after clean_up), we must work with sort_nodes_text instead of nodes_text
-
-    # Erase the caption that appears after the title in sorted_nodes_text
-    # i = 0
-    # for node in sorted_nodes_text:
-    #     first_index = node.find("*")
-    #     second_index = node.find("*", first_index + 1)  # Starts searching after the first *
-    #     title_length = second_index - first_index - 1
-    #     initial_title = node[first_index+1:second_index]
-    #     potential_caption_index = node.find(initial_title, second_index, second_index + title_length + 4)
-    #     potential_caption = node[potential_caption_index:potential_caption_index + title_length]
-    #     if initial_title == potential_caption:
-    #         node = "*" + initial_title + "*\n" + node[potential_caption_index + title_length + 1:]
-    #     sorted_nodes_text[i] = node
-    #     i = i + 1
+    # From here on (i.e. after clean_up), we must work with sorted_nodes_text instead of nodes_text
+    sorted_nodes_text = sorted(combine_nodes(texts) for texts in groups.values())
 
     return sorted_nodes_text
 
 
-def include_hyperlink(paragraph: Paragraph) -> Tuple[List[str], List[str]]:
+def include_hyperlink(paragraph: AlParagraph) -> Tuple[List[str], List[str]]:
     """
     Looks for hyperlinks in a paragraph. If found, returns the list of text that has a link and the list of its url
 
@@ -500,75 +371,425 @@ def include_hyperlink(paragraph: Paragraph) -> Tuple[List[str], List[str]]:
 
     """
 
-    # has_hyperlink = False
-    hyperlink_text, hyperlink_url = [], []
+    hyperlink_text = [link.text for link in paragraph.links]
+    hyperlink_url = [link.url for link in paragraph.links]
 
-    if len(paragraph.hyperlinks) > 0:
+    return hyperlink_text, hyperlink_url
 
-        for hyperlink in paragraph.hyperlinks:
-            hyperlink_text.append(hyperlink.text)
-            hyperlink_url.append(hyperlink.url)
 
-    return hyperlink_text, hyperlink_url
+def render_hyperlinks(paragraph: AlParagraph) -> str:
+    """
+    Returns the paragraph text with its hyperlinks in markdown format, which is built when the document is parsed
+
+    :param paragraph: The paragraph to render
+    :return: The paragraph text
+
+    """
+
+    return paragraph.markdown
+
+
+def make_node(node_number: int, text: str, events: Optional[List[AlEvent]] = None) -> AlNode:
+    node: AlNode = {
+        "node_number": node_number,
+        "type": "NarrativeText",
+        "text": text,
+        "metadata": {
+            "languages": ["eng"],
+        }
+    }
+
+    # The dated rows of the table rendered in this node, see timeline.Timeline
+    if events:
+        node["metadata"]["events"] = events
+
+    return node
+
 
+def node_events(text: str, events: Optional[Dict[str, List[AlEvent]]]) -> Optional[List[AlEvent]]:
+    return events.get(node_title(text)[1:]) if events else None
 
-def convert_to_dict(sorted_nodes_text) -> List[AlNode]:
+
+def convert_to_dict(sorted_nodes_text, events: Optional[Dict[str, List[AlEvent]]] = None) -> List[AlNode]:
     """
     Converts the sorted nodes text to a list of AlNode dictionaries.
 
     :param sorted_nodes_text: The sorted nodes text
+    :param events: The events of the tables by table title (see timeline.read_events), stored in the node with that title
     :return: List of AlNode dictionaries
 
     """
 
-    nodes: List[AlNode] = []
+    return [make_node(node_number, text, node_events(text, events)) for node_number, text in enumerate(sorted_nodes_text)]
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def split_text(text: str, budget: int, level: int = 0) -> List[Tuple[str, int]]:
+    """
+    Split a text on the CHUNK_BOUNDARIES of a level, and the pieces still over the budget on those of the next levels
+
+    :param text: The text
+    :param budget: The token budget of a piece
+    :param level: The index of the boundary in CHUNK_BOUNDARIES
+    :return: The pieces and their token counts. The pieces join back into the text, only a word can be over the budget
+
+    """
+
+    pieces: List[Tuple[str, int]] = []
+
+    for piece in CHUNK_BOUNDARIES[level].split(text):
+        if not piece:
+            continue
 
-    for node_number, text in enumerate(sorted_nodes_text):
-        nodes.append(
-            {
-                "node_number": node_number,
-                "type": "NarrativeText",
-                "text": text,
-                "metadata": {
-                    "languages": ["eng"],
-                }
-            }
+        tokens = count_tokens(piece)
+        if tokens > budget and level + 1 < len(CHUNK_BOUNDARIES):
+            pieces.extend(split_text(piece, budget, level + 1))
+        else:
+            pieces.append((piece, tokens))
+
+    return pieces
+
+
+def node_header(text: str) -> str:
+    """
+    :param text: Node text
+    :return: "*Title*" when the node starts with its title, "" otherwise
+
+    """
+
+    title = node_title(text)
+
+    return title + "*" if text.startswith("*") and title != text else ""
+
+
+def split_node_text(text: str, chunk_tokens: int) -> List[str]:
+    """
+    Split a node text over the token budget into chunk texts, filled with as many whole rows as fit. A row over the
+    budget is split on its lines, then its sentences. Every chunk starts with the *Title* of the node, then a newline.
+
+    :param text: Node text
+    :param chunk_tokens: The token budget of a chunk, title included
+    :return: The chunk texts, only the text itself when it fits the budget. The row separators are removed
+
+    """
+
+    if count_tokens(text) <= chunk_tokens:
+        return [text.replace(ROW_SEPARATOR, "")]
+
+    header = node_header(text)
+    budget = max(chunk_tokens - count_tokens(header), 1)
+
+    bodies: List[str] = []
+    body = ""
+    body_tokens = 0
+
+    for piece, tokens in split_text(text[len(header):], budget):
+        if body and body_tokens + tokens > budget:
+            bodies.append(body)
+            body = ""
+            body_tokens = 0
+
+        body += piece
+        body_tokens += tokens
+
+    if body:
+        bodies.append(body)
+
+    # The pieces start with the separator they were split on (a newline, a space), every chunk drops it the same way
+    bodies = [body.replace(ROW_SEPARATOR, "").strip() for body in bodies]
+
+    return [header + "\n" + body if header else body for body in bodies if body]
+
+
+def chunk_node(node: AlNode, node_number: int, chunk_tokens: Optional[int] = CHUNK_TOKENS) -> List[AlNode]:
+    """
+    Split a node over the token budget, so that retrieval ranks and the prompt includes only the part of a long section
+    or table that answers the query. A chunk keeps the metadata of its node, with the title of the node in "parent"
+    (None for a node without a title) and its position in "chunk" out of "chunks". The events of the node go to the
+    chunk that renders their row.
+
+    :param node: The node
+    :param node_number: The node_number of the first chunk, the next chunks follow it
+    :param chunk_tokens: The token budget of a chunk, None keeps the node whole
+    :return: The chunks, only the node itself (renumbered) when it fits the budget
+
+    """
+
+    if chunk_tokens is not None:
+        texts = split_node_text(node["text"], chunk_tokens)
+    else:
+        texts = [node["text"].replace(ROW_SEPARATOR, "")]
+
+    if len(texts) == 1:
+        return [{**node, "node_number": node_number, "text": texts[0]}]
+
+    metadata = {key: value for key, value in node["metadata"].items() if key != "events"}
+    header = node_header(node["text"])
+    parent = header[1:-1] if header else None
+
+    chunks: List[AlNode] = [
+        {
+            **node,
+            "node_number": node_number + index,
+            "text": text,
+            "metadata": {**metadata, "parent": parent, "chunk": index, "chunks": len(texts)},
+        }
+        for index, text in enumerate(texts)
+    ]
+
+    # Each event is kept once, so that the timeline does not read it again from every chunk
+    for event in node["metadata"].get("events", ()):
+        chunk = next(
+            (chunk for chunk in chunks if event["title"] in chunk["text"] and event["date_text"] in chunk["text"]),
+            chunks[0]
         )
+        chunk["metadata"].setdefault("events", []).append(event)
 
-    return nodes
+    return chunks
+
+
+def chunk_nodes(nodes: List[AlNode], chunk_tokens: Optional[int] = CHUNK_TOKENS) -> List[AlNode]:
+    """
+    Split the nodes over the token budget into chunks (see chunk_node) and number the nodes again
+
+    :param nodes: The nodes, as returned by convert_to_dict
+    :param chunk_tokens: The token budget of a node, None keeps every node whole
+    :return: The nodes and chunks, in the order of the nodes
+
+    """
+
+    chunked: List[AlNode] = []
+
+    for node in nodes:
+        chunked.extend(chunk_node(node, len(chunked), chunk_tokens))
+
+    return chunked
+
+
+def combine_nodes(texts: List[str]) -> str:
+    """
+    Combine the nodes texts that have the same title into one, the same way clean_up does
+
+    :param texts: Nodes texts with the same title
+    :return: The combined node text
+
+    """
+
+    sorted_texts = sorted(texts)
+    title_length = len(node_title(sorted_texts[0]))
+
+    # The title (and its closing *) is only kept once
+    return sorted_texts[0] + "".join(text[title_length + 1:] for text in sorted_texts[1:])
+
+
+def iter_sections(
+        document: AlDocument,
+        templates: Optional[TableTemplates] = None,
+        labels: Optional[LabelRewriter] = None
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Render the document one section at a time, in document order
+
+    :param document: The parsed document
+    :param templates: The table templates, the built-in ones by default
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: Generator of section titles and the nodes texts of the section (its text, then its tables)
+
+    """
+
+    paragraphs = document.paragraphs
+    paragraph_index = -1
+
+    # The section being read: its heading paragraph index, its title and its rendered tables
+    start: Optional[int] = None
+    title = ""
+    tables_text: List[str] = []
+    is_first = True
+
+    def render(end: int, is_last: bool) -> List[str]:
+        section_text = render_section(paragraphs, start, end, title if not is_last else paragraphs[start].text.strip(), is_last)
+
+        if is_first:
+            nodes_text = [section_text]
+            add_course_information(nodes_text, paragraphs)
+            section_text = rewrite_course_information(nodes_text[0], labels)
+
+        return [section_text] + tables_text
+
+    for block in document.blocks:
+
+        if isinstance(block, AlTable):
+            # Only tables with a heading directly above are rendered, that heading opened the current section
+            if block.title is not None and start is not None:
+                tables_text.append(render_table(block, templates))
+            continue
+
+        paragraph_index += 1
+
+        if block.is_heading and block.text.strip():
+            if start is not None:
+                yield title, render(paragraph_index, False)
+                is_first = False
+
+            start = paragraph_index
+            title = block.text.strip()
+            tables_text = []
+
+    if start is not None:
+        yield title, render(len(paragraphs), True)
+
+
+def iter_convert_file(
+        file_bytes: io.BytesIO,
+        templates: Optional[TableTemplates] = None,
+        chunk_tokens: Optional[int] = CHUNK_TOKENS,
+        labels: Optional[LabelRewriter] = None
+) -> Iterator[AlNode]:
+    """
+    Takes a docx file as a BytesIO object and yields its CriaParse nodes as soon as each section (and its tables) is rendered.
+
+    The nodes come in document order, not sorted by title like convert_file. A section is combined with the tables under it,
+    and "Faculty Members Information" is held back until it can be combined with "Tutorials". Two sections with the same
+    title that are apart in the document are yielded as two nodes.
+
+    :param file_bytes: File in io.BytesIO buffer
+    :param templates: The table templates, the built-in ones by default
+    :param chunk_tokens: The token budget of a node, the nodes over it are split into chunks. None keeps them whole
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: Generator of converted nodes
+
+    """
+
+    document: AlDocument = read_document(file_bytes)
+    events = read_events(read_tables(document)[0])
+    node_number = 0
+
+    # Tutorials and Faculty Members Information are combined for better results, whichever comes first waits for the other
+    held: Dict[str, str] = {}
+    partners = {"Tutorials": "Faculty Members Information", "Faculty Members Information": "Tutorials"}
+
+    for title, nodes_text in iter_sections(document, templates, labels):
+        # Erase empty nodes
+        nodes_text = [
+            text for text in nodes_text
+            if not (text.endswith("*\n\n") or text.endswith("*\n \n"))
+        ]
+
+        if not nodes_text:
+            continue
+
+        text = combine_nodes(nodes_text)
+
+        if title in partners:
+            partner = partners[title]
+
+            if partner not in held:
+                held[title] = text
+                continue
+
+            partner_text = held.pop(partner)
+            text = text + partner_text if title == "Tutorials" else partner_text + text
+
+        for node in chunk_node(make_node(node_number, text, node_events(text, events)), node_number, chunk_tokens):
+            yield node
+            node_number += 1
+
+    for text in held.values():
+        for node in chunk_node(make_node(node_number, text, node_events(text, events)), node_number, chunk_tokens):
+            yield node
+            node_number += 1
 
 
 def convert_file(
-        file_bytes: io.BytesIO
+        file_bytes: io.BytesIO,
+        cache: Optional[NodeCache] = None,
+        observer: Optional[StageObserver] = None,
+        templates: Optional[TableTemplates] = None,
+        chunk_tokens: Optional[int] = CHUNK_TOKENS,
+        labels: Optional[LabelRewriter] = None
 ) -> List[dict]:
     """
     Takes a docx file as a BytesIO object and converts it to CriaParse nodes.
 
+    The observer receives the duration, the allocation delta (when tracemalloc is tracing) and the input and output sizes
+    of each stage. Sizes are in bytes for the file, then in blocks, paragraphs, sections, tables and characters of nodes texts.
+
     :param file_bytes: File in io.BytesIO buffer
+    :param cache: Optional cache of converted nodes, keyed by the file content and the converter version
+    :param observer: Optional callable receiving the metrics of each stage, see metrics.py for exporters
+    :param templates: The table templates (see table_templates.load_templates), the built-in ones by default
+    :param chunk_tokens: The token budget of a node, the nodes over it are split into chunks. None keeps them whole
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
     :return: Converted nodes
 
     """
 
-    docx_file: Document = Document(file_bytes)
-    html_text: str = mammoth.convert_to_html(file_bytes).value
-    sections: List[str] = find_h_level(docx_file)
+    if cache is not None:
+        key = cache_key(file_bytes.getvalue(), converter_version(templates, chunk_tokens, labels))
+        cached_nodes = cache.get(key)
+
+        # A hit skips the parsing and the rendering entirely
+        if cached_nodes is not None:
+            return cached_nodes
+
+        nodes = convert_file(file_bytes, observer=observer, templates=templates, chunk_tokens=chunk_tokens, labels=labels)
+        cache.put(key, nodes)
+
+        return nodes
+
+    # The docx is parsed once and every stage reads from the parsed blocks
+    with measure_stage(observer, "read_document", file_bytes.getbuffer().nbytes) as stage:
+        document: AlDocument = read_document(file_bytes)
+        stage["output_size"] = len(document.blocks)
+
+    with measure_stage(observer, "find_h_level", len(document.paragraphs)) as stage:
+        sections: List[str] = find_h_level(document)
+        stage["output_size"] = len(sections)
 
     # The sections in the sections list are assigned a paragraph
-    section_paragraphs = find_sections_paragraphs(sections, docx_file)
+    with measure_stage(observer, "find_sections_paragraphs", len(sections)) as stage:
+        section_paragraphs = find_sections_paragraphs(sections, document)
+        stage["output_size"] = len(section_paragraphs)
 
     # The doc is converted to a list of semantic sections containing the text
-    nodes_text = convert_doc_to_nodes(section_paragraphs, docx_file, sections)
+    with measure_stage(observer, "convert_doc_to_nodes", len(document.paragraphs)) as stage:
+        nodes_text = convert_doc_to_nodes(section_paragraphs, document, sections)
+        stage["output_size"] = sum(len(text) for text in nodes_text)
+
+    # I need the tables created in read_table to use in render_tables_add_to_notes, where the tables are rendered
+    with measure_stage(observer, "read_tables", len(document.tables)) as stage:
+        doc_tables, table_titles = read_tables(document)
+        stage["output_size"] = len(table_titles)
 
-    # I need the dataframe created in read_table to use in render_tables_add_to_notes, where the dataframe is rendered
-    doc_tables_df, table_titles = read_tables(html_text, sections)
+    # The dated rows of the evaluation and schedule tables, for the next/previous/today questions
+    with measure_stage(observer, "read_events", len(doc_tables)) as stage:
+        events = read_events(doc_tables)
+        stage["output_size"] = sum(len(table_events) for table_events in events.values())
 
     # Where the rendering of tables is done and added to the list nodes_text
-    render_tables_add_to_nodes_text(table_titles, nodes_text, doc_tables_df)
+    sections_length = sum(len(text) for text in nodes_text)
+    with measure_stage(observer, "render_tables_add_to_nodes_text", len(table_titles)) as stage:
+        render_tables_add_to_nodes_text(table_titles, nodes_text, doc_tables, templates)
+        stage["output_size"] = sum(len(text) for text in nodes_text) - sections_length
 
     # Final touches to clean up the list
-    sorted_nodes_text: List[Any] = clean_up(nodes_text)
+    with measure_stage(observer, "clean_up", sum(len(text) for text in nodes_text)) as stage:
+        sorted_nodes_text: List[Any] = clean_up(nodes_text, labels)
+        stage["output_size"] = sum(len(text) for text in sorted_nodes_text)
 
-    return convert_to_dict(sorted_nodes_text)
+    with measure_stage(observer, "convert_to_dict", len(sorted_nodes_text)) as stage:
+        nodes = convert_to_dict(sorted_nodes_text, events)
+        stage["output_size"] = len(nodes)
+
+    # Long sections and tables are split to the token budget, so that rerank and the prompt get only what they need
+    with measure_stage(observer, "chunk_nodes", len(nodes)) as stage:
+        nodes = chunk_nodes(nodes, chunk_tokens)
+        stage["output_size"] = len(nodes)
+
+    return nodes
 
 
 if __name__ == '__main__':
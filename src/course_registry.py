@@ -0,0 +1,381 @@
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from al_types import AlCourseDocument, AlNode
+from bm25_index import Bm25Index
+from conversions import LabelRewriter, converter_version
+from docx_blocks import read_document
+from incremental import reconvert_document
+from node_cache import NodeCache, cache_key
+from node_store import NodeStore
+from query_intent import QueryRouter
+from retrieval_cache import node_set_key
+from table_templates import TableTemplates
+from timeline import Timeline
+from vector_index import EmbeddingStore, Embedder, VectorIndex
+
+# (modification time in nanoseconds, size) of a source file, a change means the course must be reloaded
+Signature = Tuple[int, int]
+
+
+class Course(NamedTuple):
+    course_id: str
+    paths: Tuple[str, ...]  # The documents of the course, the syllabus first
+    signatures: Tuple[Signature, ...]  # Of the documents when they were loaded
+    course_number: str  # First paragraph of the syllabus
+    course_title: str  # Second paragraph of the syllabus
+    nodes: NodeStore  # The candidate pool: the nodes of every document, tagged with their source
+    nodes_key: str  # retrieval_cache.node_set_key of the nodes, computed once
+    bm25_index: Bm25Index
+    timeline: Timeline
+    vector_index: Optional[VectorIndex]  # Embeddings of the nodes, when the course is loaded with an embedder
+    router: QueryRouter
+    size: int  # Approximate memory used by the course, in bytes
+
+
+def source_signature(path: str) -> Signature:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def source_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def merge_documents(documents: Dict[str, Sequence[AlNode]]) -> List[AlNode]:
+    """
+    Merge the nodes of the documents of a course (the syllabus, the Questions document...) into one candidate pool,
+    so that a query is answered with one retrieval over all of them
+
+    :param documents: Source name -> nodes of the document, in the order of the pool
+    :return: The nodes, numbered from 0 across the documents (the index in the pool), the source name in metadata["source"]
+
+    """
+
+    pool: List[AlNode] = []
+
+    for source, nodes in documents.items():
+        for node in nodes:
+            pool.append({
+                **node,
+                "node_number": len(pool),
+                "metadata": {**node["metadata"], "source": source},
+            })
+
+    return pool
+
+
+def approximate_size(value: Any, seen: Optional[Dict[int, Any]] = None) -> int:
+    """
+    Approximate memory used by an object and everything it references (containers, instance attributes and slots)
+
+    :param value: The object
+    :param seen: The objects already counted by id, kept referenced so that their ids are not reused during the walk
+    :return: Size in bytes
+
+    """
+
+    seen = {} if seen is None else seen
+    if id(value) in seen or isinstance(value, type):
+        return 0
+
+    seen[id(value)] = value
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(approximate_size(key, seen) + approximate_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__") or hasattr(value, "__slots__"):
+        size += approximate_size(getattr(value, "__dict__", {}), seen)
+        size += sum(approximate_size(getattr(value, name), seen) for name in getattr(value, "__slots__", ()) if hasattr(value, name))
+
+    return size
+
+
+def convert_course_document(
+        path: str,
+        templates: Optional[TableTemplates] = None,
+        cache: Optional[NodeCache] = None,
+        labels: Optional[LabelRewriter] = None
+) -> AlCourseDocument:
+    """
+    Convert a document of a course, through the node cache when one is given. The nodes are cached in one entry with
+    the first two paragraphs, so that a hit does not parse the document at all.
+
+    :param path: The .docx file
+    :param templates: The table templates, the built-in ones by default
+    :param cache: Optional cache of converted nodes
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: The nodes and the first two paragraphs (the course rubric and number, and the course title)
+
+    """
+
+    with open(path, "rb") as docx_file:
+        file_bytes = docx_file.read()
+
+    # Not the key of convert_file, which caches the nodes alone
+    key = cache_key(file_bytes, converter_version(templates, labels=labels) + "+course")
+
+    if cache is not None:
+        cached_document = cache.get(key)
+        if cached_document is not None:
+            return cached_document
+
+    document = read_document(io.BytesIO(file_bytes))
+    course_document: AlCourseDocument = {
+        "nodes": reconvert_document(document, templates=templates, labels=labels)["nodes"],
+        "course_number": document.paragraphs[0].text.strip() if document.paragraphs else "",
+        "course_title": document.paragraphs[1].text.strip() if len(document.paragraphs) > 1 else "",
+    }
+
+    if cache is not None:
+        cache.put(key, course_document)
+
+    return course_document
+
+
+def load_course(
+        course_id: str,
+        paths: Sequence[str],
+        templates: Optional[TableTemplates] = None,
+        cache: Optional[NodeCache] = None,
+        embedder: Optional[Embedder] = None,
+        embedding_store: Optional[EmbeddingStore] = None,
+        labels: Optional[LabelRewriter] = None
+) -> Course:
+    """
+    Convert the documents of a course and build everything a query needs: the candidate pool of their nodes, its BM25
+    index, its vector index, the timeline and the query router. Use functools.partial to give the registry a loader
+    with other arguments.
+
+    :param course_id: The course ID
+    :param paths: The .docx files of the course, the syllabus first (the course number, title and timeline come from it)
+    :param templates: The table templates, the built-in ones by default
+    :param cache: Optional cache of converted nodes, unchanged documents are then loaded without being parsed
+    :param embedder: Embeds the nodes for the vector index (e.g. vector_index.OpenAIEmbedder), no vector index without it
+    :param embedding_store: Keeps the node embeddings on disk, so that they are only computed once per conversion
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: The loaded course
+
+    """
+
+    paths = tuple(paths)
+    signatures = tuple(source_signature(path) for path in paths)
+    documents: Dict[str, List[AlNode]] = {}
+    course_number = course_title = ""
+
+    for position, path in enumerate(paths):
+        course_document = convert_course_document(path, templates, cache, labels)
+
+        if position == 0:
+            course_number, course_title = course_document["course_number"], course_document["course_title"]
+
+        # Two documents with the same file name are told apart by their path
+        source = source_name(path) if source_name(path) not in documents else path
+        documents[source] = course_document["nodes"]
+
+    nodes = NodeStore.from_nodes(merge_documents(documents))
+    nodes_key = node_set_key(nodes)
+
+    if embedder is None:
+        vector_index = None
+    elif embedding_store is not None:
+        vector_index = embedding_store.get_or_build(nodes_key, nodes, embedder)
+    else:
+        vector_index = VectorIndex.build(nodes, embedder)
+
+    bm25_index = Bm25Index(list(nodes.texts()))
+    timeline = Timeline.from_nodes(next(iter(documents.values()), []))  # the dates of the syllabus
+    router = QueryRouter(course_number, course_title)
+    size = approximate_size([nodes, bm25_index, timeline, vector_index, router])
+
+    return Course(
+        course_id, paths, signatures, course_number, course_title, nodes, nodes_key, bm25_index, timeline, vector_index,
+        router, size
+    )
+
+
+class CourseRegistry:
+    """
+    The courses served by a process, keyed by course ID. The nodes of the documents of a course are merged into one
+    candidate pool. A course is loaded on its first query, the least recently used courses are evicted when the loaded
+    courses use more than max_bytes, and a course whose documents changed is reloaded in the background while the
+    previous version keeps answering.
+
+    """
+
+    def __init__(
+            self,
+            sources: Optional[Dict[str, Sequence[str]]] = None,
+            max_bytes: int = 512 * 1024 * 1024,
+            loader: Callable[[str, Tuple[str, ...]], Course] = load_course
+    ):
+        """
+        :param sources: Course ID -> .docx paths of the course documents, the syllabus first
+        :param max_bytes: Memory budget of the loaded courses. The course that was just used is never evicted
+        :param loader: Loads a course from its ID and paths, load_course by default
+
+        """
+
+        self.sources: Dict[str, Tuple[str, ...]] = {course_id: tuple(paths) for course_id, paths in (sources or {}).items()}
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.total_bytes = 0
+        self.loads = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+        # Course ID -> loaded course, from least to most recently used
+        self._courses: OrderedDict[str, Course] = OrderedDict()
+
+        # Course ID -> lock held while the course loads, so that concurrent queries load it once
+        self._loading: Dict[str, threading.Lock] = {}
+
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, course_id: str, *paths: str) -> None:
+        """
+        :param course_id: The course ID
+        :param paths: The .docx files of the course, the syllabus first, then the other documents such as the Questions
+
+        """
+
+        with self._lock:
+            self.sources[course_id] = paths
+
+    def __contains__(self, course_id: str) -> bool:
+        return course_id in self.sources
+
+    def loaded(self) -> Tuple[str, ...]:
+        """
+        :return: IDs of the loaded courses, from least to most recently used
+
+        """
+
+        with self._lock:
+            return tuple(self._courses)
+
+    def get(self, course_id: str) -> Course:
+        """
+        Get a course, loading it if needed
+
+        :param course_id: The course ID
+        :return: The loaded course
+
+        """
+
+        with self._lock:
+            course = self._courses.get(course_id)
+            if course is not None:
+                self._courses.move_to_end(course_id)
+                return course
+
+            if course_id not in self.sources:
+                raise KeyError(f"Unknown course {course_id!r}")
+
+            loading = self._loading.setdefault(course_id, threading.Lock())
+
+        with loading:
+            # Another thread may have loaded it while this one waited
+            with self._lock:
+                course = self._courses.get(course_id)
+                if course is not None:
+                    self._courses.move_to_end(course_id)
+                    return course
+
+            return self._store(self.loader(course_id, self.sources[course_id]))
+
+    def _store(self, course: Course) -> Course:
+        with self._lock:
+            return self._store_locked(course)
+
+    def _store_locked(self, course: Course) -> Course:
+        # Called with the lock held
+        previous = self._courses.pop(course.course_id, None)
+        if previous is not None:
+            self.total_bytes -= previous.size
+
+        self._courses[course.course_id] = course
+        self.total_bytes += course.size
+        self.loads += 1
+
+        while self.total_bytes > self.max_bytes and len(self._courses) > 1:
+            _, evicted = self._courses.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+
+        return course
+
+    def evict(self, course_id: str) -> None:
+        with self._lock:
+            course = self._courses.pop(course_id, None)
+            if course is not None:
+                self.total_bytes -= course.size
+
+    def reload_changed(self) -> Tuple[str, ...]:
+        """
+        Reload the loaded courses whose documents changed since they were loaded. A course keeps being served from its
+        previous version until the new one is loaded, a course that fails to load keeps its previous version.
+
+        :return: IDs of the reloaded courses
+
+        """
+
+        with self._lock:
+            courses = list(self._courses.values())
+
+        reloaded = []
+        for course in courses:
+            paths = self.sources.get(course.course_id, course.paths)
+            try:
+                if paths == course.paths and tuple(source_signature(path) for path in paths) == course.signatures:
+                    continue
+
+                # A file may be mid-save, it is checked again on the next pass
+                new_course = self.loader(course.course_id, paths)
+            except Exception:
+                continue
+
+            with self._lock:
+                # An evicted or already replaced course is not put back (an evicted one loads again on its next query).
+                # The check and the store hold the lock together, so no evict or other reload can come in between
+                if self._courses.get(course.course_id) is not course:
+                    continue
+
+                self._store_locked(new_course)
+
+            reloaded.append(course.course_id)
+
+        return tuple(reloaded)
+
+    def watch(self, interval: float = 5.0) -> None:
+        """
+        Check the syllabi of the loaded courses for changes every interval seconds, in a daemon thread
+
+        :param interval: Seconds between checks
+
+        """
+
+        if self._watcher is not None:
+            return
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                self.reload_changed()
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=run, name="course-registry-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
@@ -0,0 +1,120 @@
+import io
+from typing import List, Optional, Union
+
+from docx import Document
+from docx.oxml.ns import qn
+from docx.table import Table, _Cell
+from docx.text.hyperlink import Hyperlink
+from docx.text.paragraph import Paragraph
+
+from al_types import AlCell, AlDocument, AlLink, AlParagraph, AlTable
+
+
+def read_paragraph(paragraph: Paragraph) -> AlParagraph:
+    """
+    Snapshot a python-docx paragraph into an AlParagraph.
+    The text and its markdown version are built in one walk over the runs and hyperlinks, the paragraph is not modified.
+
+    :param paragraph: The paragraph to read
+    :return: The paragraph text, its markdown, its hyperlinks and whether it is a heading
+
+    """
+
+    text_parts: List[str] = []
+    markdown_parts: List[str] = []
+    links: List[AlLink] = []
+
+    for item in paragraph.iter_inner_content():
+        item_text = item.text
+        text_parts.append(item_text)
+
+        if isinstance(item, Hyperlink):
+            url = item.url
+            links.append(AlLink(item_text, url))
+
+            # Follows the markdown format, internal links (no url) stay plain text
+            markdown_parts.append("[" + item_text + "](" + url + ")" if url else item_text)
+        else:
+            markdown_parts.append(item_text)
+
+    return AlParagraph("".join(text_parts), "".join(markdown_parts), tuple(links), paragraph.style.name.startswith('Heading'))
+
+
+def read_cell(cell: _Cell) -> AlCell:
+    """
+    Read the text and the first link of a table cell.
+    The paragraphs of the cell (including nested tables) are joined without separator and line breaks are dropped.
+
+    :param cell: The table cell
+    :return: The cell text and url ("" when the cell has no link)
+
+    """
+
+    text = ""
+    url = ""
+
+    for p in cell._tc.iter(qn('w:p')):
+        paragraph = Paragraph(p, cell)
+        text += paragraph.text.replace("\n", "")
+
+        if not url:
+            url = next((hyperlink.url for hyperlink in paragraph.hyperlinks if hyperlink.url), "")
+
+    return AlCell(text, url)
+
+
+def read_table(table: Table, title: Optional[str]) -> AlTable:
+    """
+    Read the rows of a table.
+    Vertically merged cells only appear in the first row of the merge.
+
+    :param table: The table
+    :param title: The heading directly above the table, if any
+    :return: The table rows as cells
+
+    """
+
+    rows = []
+    for tr in table._tbl.tr_lst:
+        rows.append(tuple(read_cell(_Cell(tc, table)) for tc in tr.tc_lst if tc.vMerge != "continue"))
+
+    return AlTable(title, tuple(rows))
+
+
+def read_document(file_bytes: io.BytesIO) -> AlDocument:
+    """
+    Parse a docx file once into an ordered block model of paragraphs (headings included) and tables.
+
+    :param file_bytes: File in io.BytesIO buffer
+    :return: The document blocks
+
+    """
+
+    docx_file = Document(file_bytes)
+
+    blocks: List[Union[AlParagraph, AlTable]] = []
+    paragraphs: List[AlParagraph] = []
+    tables: List[AlTable] = []
+
+    # The last non-empty paragraph, used to give tables the heading directly above them as title
+    previous: Optional[AlParagraph] = None
+
+    for item in docx_file.iter_inner_content():
+
+        if isinstance(item, Paragraph):
+            paragraph = read_paragraph(item)
+            blocks.append(paragraph)
+            paragraphs.append(paragraph)
+
+            # Empty paragraphs between a heading and its table do not break the title
+            if paragraph.text:
+                previous = paragraph
+
+        else:
+            title = previous.text.strip() if previous is not None and previous.is_heading else None
+            table = read_table(item, title or None)
+            blocks.append(table)
+            tables.append(table)
+            previous = None
+
+    return AlDocument(tuple(blocks), tuple(paragraphs), tuple(tables))
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from al_types import AlEvaluationRecord
+from query_pipeline import QueryPipeline
+
+
+def read_question_bank(path: str, sheet_name: str = 'Sheet1') -> pd.DataFrame:
+    """
+    Read the question bank once, the questions are in its "Queries" column
+
+    :param path: Excel file of the question bank
+    :param sheet_name: Sheet with the questions
+    :return: The question bank
+
+    """
+
+    return pd.read_excel(path, sheet_name=sheet_name)
+
+
+def read_checkpoint(path: str, questions: Optional[Sequence[str]] = None) -> Dict[int, AlEvaluationRecord]:
+    """
+    Read the answered questions of a previous run from its JSONL results.
+    Failed questions are left out so that they are asked again, as is a line cut short by a crash.
+
+    :param path: JSONL results of the run
+    :param questions: The questions of the question bank, a record is only kept if its question is still at its position
+    :return: Record of each answered question, by position in the question bank
+
+    """
+
+    records: Dict[int, AlEvaluationRecord] = {}
+
+    if not os.path.exists(path):
+        return records
+
+    with open(path, encoding="utf-8") as checkpoint:
+        for line in checkpoint:
+            try:
+                record: AlEvaluationRecord = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if record["error"] is not None:
+                continue
+
+            position = record["position"]
+            if questions is None or (position < len(questions) and questions[position] == record["question"]):
+                records[position] = record
+
+    return records
+
+
+async def run_evaluation(
+        pipeline: QueryPipeline,
+        questions: Sequence[str],
+        output_path: str,
+        candidate_lists: Optional[Sequence[Optional[Sequence[int]]]] = None
+) -> List[AlEvaluationRecord]:
+    """
+    Answer the question bank through the pipeline, as many questions at once as its concurrency limit allows.
+    Each record is appended to the JSONL output as soon as its question is answered, so the output is also the
+    checkpoint: running again with the same output only asks the questions that were not answered yet (or that changed).
+
+    :param pipeline: The query pipeline of the course, configure its max_retries for rate limits and timeouts
+    :param questions: The questions of the question bank, in order
+    :param output_path: JSONL results, created or resumed
+    :param candidate_lists: Optional candidates of each question, see QueryPipeline.answer
+    :return: One record per question, in question bank order. Failed questions have their error set
+
+    """
+
+    records: Dict[int, AlEvaluationRecord] = read_checkpoint(output_path, questions)
+    pending = [position for position in range(len(questions)) if position not in records]
+
+    async def evaluate(position: int) -> AlEvaluationRecord:
+        candidates = candidate_lists[position] if candidate_lists is not None else None
+        answer = await pipeline.answer(questions[position], candidates)
+        return {"position": position, "question": questions[position], **answer}
+
+    # A crash can leave the last line without its end of line, the next record must not be glued to it
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as checkpoint:
+            checkpoint.seek(-1, os.SEEK_END)
+            needs_newline = checkpoint.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    with open(output_path, "a", encoding="utf-8") as output:
+        if needs_newline:
+            output.write("\n")
+
+        for evaluation in asyncio.as_completed([evaluate(position) for position in pending]):
+            record = await evaluation
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            records[record["position"]] = record
+
+    return [records[position] for position in range(len(questions))]
+
+
+def export_results(question_bank: pd.DataFrame, records: Sequence[AlEvaluationRecord], path: str) -> None:
+    """
+    Write the question bank with the relevance, node index, query and answer of each question in front of it,
+    to an Excel file, or to a Parquet file when the path ends with .parquet
+
+    :param question_bank: The question bank the records answer, in the same order
+    :param records: The records of run_evaluation
+    :param path: Output file
+
+    """
+
+    results = question_bank.copy()
+    results.insert(0, 'Relevance', [record["relevance_score"] for record in records])
+    results.insert(1, 'Index', [record["index"] for record in records])
+    results.insert(2, 'Query', [record["question"] for record in records])
+    results.insert(3, 'Answer', [record["answer"] for record in records])
+
+    if any(record["error"] is not None for record in records):
+        results['Error'] = [record["error"] for record in records]
+
+    if path.endswith(".parquet"):
+        results.to_parquet(path, index=False)
+    else:
+        results.to_excel(path, sheet_name='Sheet1', index=False, engine='openpyxl')
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from al_types import AlConversionState, AlDocument, AlNode, AlParagraph, AlReconversion, AlTable
+from conversions import (
+    CHUNK_TOKENS, LabelRewriter, add_course_information, chunk_nodes, clean_up, convert_to_dict, converter_version,
+    find_h_level, find_sections_paragraphs, node_header, read_tables, render_section, render_table
+)
+from docx_blocks import read_document
+from table_templates import TableTemplates
+from timeline import read_events
+
+
+def fingerprint(value: Any) -> str:
+    """
+    Hash of a JSON-serializable value (the block model tuples included)
+
+    :param value: The value to hash
+    :return: Hexadecimal fingerprint
+
+    """
+
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def section_fingerprint(paragraphs: Sequence[AlParagraph], start: int, end: int, title: str, is_last: bool) -> str:
+    return fingerprint([title, is_last, paragraphs[start + 1:end]])
+
+
+def table_fingerprint(table: AlTable) -> str:
+    return fingerprint([table.title, table.rows])
+
+
+def node_identity(node: AlNode) -> str:
+    """
+    :param node: A node or chunk
+    :return: What the node is independently of its position: its title and chunk, or its text hash when it has no title
+
+    """
+
+    header = node_header(node["text"])
+    if not header:
+        return fingerprint(node["text"])
+
+    return fingerprint([header, node["metadata"].get("chunk")])
+
+
+def reconvert_document(
+        document: AlDocument,
+        previous: Optional[AlConversionState] = None,
+        templates: Optional[TableTemplates] = None,
+        chunk_tokens: Optional[int] = CHUNK_TOKENS,
+        labels: Optional[LabelRewriter] = None
+) -> AlReconversion:
+    """
+    Convert a parsed document, re-rendering only the sections and tables that changed since the previous conversion
+
+    :param document: The parsed document
+    :param previous: The state of the previous conversion of the same document, if any
+    :param templates: The table templates, the built-in ones by default
+    :param chunk_tokens: The token budget of a node, the nodes over it are split into chunks. None keeps them whole
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: The nodes, the new state, the node numbers that changed and the previous ones that moved or were removed
+
+    """
+
+    version = converter_version(templates, chunk_tokens, labels)
+
+    # Rendered texts are only reused if they were produced by this converter (and the same templates, labels and budget)
+    if previous is not None and previous["converter_version"] != version:
+        previous = None
+
+    previous_sections: Dict[str, str] = previous["sections"] if previous is not None else {}
+    previous_tables: Dict[str, str] = previous["tables"] if previous is not None else {}
+    previous_nodes = previous["nodes"] if previous is not None else []
+
+    paragraphs = document.paragraphs
+    sections = find_h_level(document)
+    section_paragraphs = find_sections_paragraphs(sections, document)
+
+    state: AlConversionState = {"converter_version": version, "sections": {}, "tables": {}, "nodes": []}
+    nodes_text: List[str] = []
+
+    # Same section boundaries and titles as convert_doc_to_nodes
+    for i, start in enumerate(section_paragraphs):
+        is_last = i == len(section_paragraphs) - 1
+        end = len(paragraphs) if is_last else section_paragraphs[i + 1]
+        title = paragraphs[start].text.strip() if is_last else sections[i]
+
+        key = section_fingerprint(paragraphs, start, end, title, is_last)
+        text = previous_sections.get(key)
+
+        if text is None:
+            text = render_section(paragraphs, start, end, title, is_last)
+
+        state["sections"][key] = text
+        nodes_text.append(text)
+
+    add_course_information(nodes_text, paragraphs)
+
+    for table in document.tables:
+        if table.title is None:
+            continue
+
+        key = table_fingerprint(table)
+        text = previous_tables.get(key)
+
+        if text is None:
+            text = render_table(table, templates)
+
+        state["tables"][key] = text
+        nodes_text.append(text)
+
+    events = read_events(read_tables(document)[0])
+    nodes = chunk_nodes(convert_to_dict(clean_up(nodes_text, labels), events), chunk_tokens)
+    state["nodes"] = nodes
+
+    # Nodes are matched by identity, so that inserting a section does not report every node after it as changed
+    previous_by_identity = {node_identity(node): node for node in previous_nodes}
+    identities = set()
+    changed: List[int] = []
+    renumbered: Dict[int, int] = {}
+
+    for node in nodes:
+        identity = node_identity(node)
+        identities.add(identity)
+        previous_node = previous_by_identity.get(identity)
+
+        if previous_node is None or any(previous_node[key] != node[key] for key in ("text", "metadata")):
+            changed.append(node["node_number"])
+        elif previous_node["node_number"] != node["node_number"]:
+            renumbered[previous_node["node_number"]] = node["node_number"]
+
+    removed = [node["node_number"] for node in previous_nodes if node_identity(node) not in identities]
+
+    return {"nodes": nodes, "state": state, "changed": changed, "renumbered": renumbered, "removed": removed}
+
+
+def reconvert_file(
+        file_bytes: io.BytesIO,
+        previous: Optional[AlConversionState] = None,
+        templates: Optional[TableTemplates] = None,
+        chunk_tokens: Optional[int] = CHUNK_TOKENS,
+        labels: Optional[LabelRewriter] = None
+) -> AlReconversion:
+    """
+    Takes a re-uploaded docx file as a BytesIO object and converts it, reusing the unchanged sections and tables of the previous conversion.
+
+    :param file_bytes: File in io.BytesIO buffer
+    :param previous: The state of the previous conversion, as returned in the "state" of the last reconversion
+    :param templates: The table templates, the built-in ones by default
+    :param chunk_tokens: The token budget of a node, the nodes over it are split into chunks. None keeps them whole
+    :param labels: The label rewriter of the Course Information section, COURSE_INFORMATION_LABELS by default
+    :return: The nodes, the new state, the node numbers that changed and the previous ones that moved or were removed
+
+    """
+
+    return reconvert_document(read_document(file_bytes), previous, templates, chunk_tokens, labels)
@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, TextIO, Tuple
+
+from al_types import AlCompletionMetrics, AlStageMetrics
+
+StageObserver = Callable[[AlStageMetrics], None]
+CompletionObserver = Callable[[AlCompletionMetrics], None]
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@contextmanager
+def measure_stage(observer: Optional[StageObserver], stage: str, input_size: int) -> Iterator[AlStageMetrics]:
+    """
+    Measure a stage of the conversion and send its metrics to the observer.
+    The caller sets "output_size" on the yielded metrics before leaving the block.
+
+    :param observer: Receives the metrics of the stage, nothing is measured when None
+    :param stage: Name of the stage
+    :param input_size: Size of the stage input
+    :return: The metrics of the stage
+
+    """
+
+    metrics: AlStageMetrics = {
+        "stage": stage,
+        "seconds": 0.0,
+        "allocated_bytes": None,
+        "input_size": input_size,
+        "output_size": 0,
+    }
+
+    if observer is None:
+        yield metrics
+        return
+
+    tracing = tracemalloc.is_tracing()
+    allocated_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+    start = time.perf_counter()
+
+    yield metrics
+
+    metrics["seconds"] = time.perf_counter() - start
+    if tracing:
+        metrics["allocated_bytes"] = tracemalloc.get_traced_memory()[0] - allocated_before
+
+    observer(metrics)
+
+
+class JsonLinesExporter:
+    """
+    Observer that writes each metrics record (of a stage or of a completion) as one JSON line
+
+    """
+
+    def __init__(self, output: TextIO):
+        self.output = output
+
+    def __call__(self, metrics: Mapping[str, Any]) -> None:
+        self.output.write(json.dumps(metrics) + "\n")
+
+
+class PrometheusExporter:
+    """
+    Observer that accumulates the metrics of each stage and renders them in the Prometheus text format
+
+    """
+
+    def __init__(self, prefix: str = "al_conversion_stage"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+
+        # Stage -> metric name -> running total
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def __call__(self, metrics: AlStageMetrics) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(metrics["stage"], {
+                "calls_total": 0, "seconds_total": 0.0, "allocated_bytes_total": 0,
+                "input_size_total": 0, "output_size_total": 0,
+            })
+            totals["calls_total"] += 1
+            totals["seconds_total"] += metrics["seconds"]
+            totals["allocated_bytes_total"] += metrics["allocated_bytes"] or 0
+            totals["input_size_total"] += metrics["input_size"]
+            totals["output_size_total"] += metrics["output_size"]
+
+    def render(self) -> str:
+        """
+        Render the accumulated metrics, one counter per metric with a "stage" label
+
+        :return: Prometheus text exposition format
+
+        """
+
+        with self._lock:
+            stages = {stage: dict(totals) for stage, totals in self._totals.items()}
+
+        lines = []
+        for name in ("calls_total", "seconds_total", "allocated_bytes_total", "input_size_total", "output_size_total"):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+
+            for stage, totals in sorted(stages.items()):
+                lines.append(f'{metric}{{stage="{stage}"}} {totals[name]:.17g}')
+
+        return "\n".join(lines) + "\n"
+
+
+class CompletionTimer:
+    """
+    Measures a chat completion while it is received: time to first token, total latency and token counts
+
+    """
+
+    def __init__(self, deployment: str, streamed: bool):
+        self.metrics: AlCompletionMetrics = {
+            "deployment": deployment,
+            "streamed": streamed,
+            "seconds_to_first_token": None,
+            "seconds": 0.0,
+            "chunks": 0,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+        }
+        self._start = time.perf_counter()
+
+    def token(self) -> None:
+        """
+        Record a chunk of content, the first one sets the time to first token
+
+        """
+
+        if self.metrics["seconds_to_first_token"] is None:
+            self.metrics["seconds_to_first_token"] = time.perf_counter() - self._start
+
+        self.metrics["chunks"] += 1
+
+    def finish(self, observer: Optional[CompletionObserver], usage: Optional[Any] = None) -> AlCompletionMetrics:
+        """
+        Record the end of the completion and send its metrics to the observer
+
+        :param observer: Receives the metrics, may be None
+        :param usage: The usage of the response (prompt_tokens, completion_tokens), if the provider sent it
+        :return: The metrics of the completion
+
+        """
+
+        self.metrics["seconds"] = time.perf_counter() - self._start
+
+        if usage is not None:
+            self.metrics["prompt_tokens"] = usage.prompt_tokens
+            self.metrics["completion_tokens"] = usage.completion_tokens
+
+        if observer is not None:
+            observer(self.metrics)
+
+        return self.metrics
+
+
+class PrometheusCompletionExporter:
+    """
+    Observer that accumulates the metrics of chat completions and renders them in the Prometheus text format:
+    token counters, and histograms of the time to first token and of the total latency
+
+    """
+
+    def __init__(self, prefix: str = "al_completion", buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+
+        self._counters: Dict[str, int] = {"requests_total": 0, "prompt_tokens_total": 0, "completion_tokens_total": 0}
+
+        # Histogram name -> count per bucket (the last one is +Inf), and the sum of the observations
+        self._histograms: Dict[str, List[int]] = {name: [0] * (len(buckets) + 1) for name in ("first_token_seconds", "seconds")}
+        self._sums: Dict[str, float] = {name: 0.0 for name in self._histograms}
+
+    def observe(self, name: str, value: float) -> None:
+        bucket = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self._histograms[name][bucket] += 1
+        self._sums[name] += value
+
+    def __call__(self, metrics: AlCompletionMetrics) -> None:
+        with self._lock:
+            self._counters["requests_total"] += 1
+            self._counters["prompt_tokens_total"] += metrics["prompt_tokens"] or 0
+            self._counters["completion_tokens_total"] += metrics["completion_tokens"] or 0
+
+            if metrics["seconds_to_first_token"] is not None:
+                self.observe("first_token_seconds", metrics["seconds_to_first_token"])
+            self.observe("seconds", metrics["seconds"])
+
+    def render(self) -> str:
+        """
+        Render the accumulated metrics
+
+        :return: Prometheus text exposition format
+
+        """
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: list(counts) for name, counts in self._histograms.items()}
+            sums = dict(self._sums)
+
+        lines = []
+        for name, value in counters.items():
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        for name, counts in histograms.items():
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+
+            cumulative = 0
+            for bound, count in zip([f"{bound:g}" for bound in self.buckets] + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+
+            lines.append(f"{metric}_sum {sums[name]:.17g}")
+            lines.append(f"{metric}_count {cumulative}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import List, Optional, Union
+
+from al_types import AlCourseDocument, AlNode
+
+# Nodes as cached by convert_file, or a course document with its heading as cached by course_registry
+CachedValue = Union[List[AlNode], AlCourseDocument]
+
+
+def cache_key(file_bytes: bytes, converter_version: str) -> str:
+    """
+    Content address of a converted file: the hash of the docx bytes and of the converter version
+
+    :param file_bytes: The docx file bytes
+    :param converter_version: Version of the converter that produced the nodes
+    :return: Hexadecimal key
+
+    """
+
+    digest = hashlib.sha256(converter_version.encode("utf-8") + b"\0")
+    digest.update(file_bytes)
+
+    return digest.hexdigest()
+
+
+class NodeCache:
+    """
+    On-disk cache of converted nodes, one JSON file per key.
+    The total size of the files is bounded, the least recently used files are evicted first.
+
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+        # Key -> file size, from least to most recently used
+        self._entries: OrderedDict[str, int] = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+
+        # The modification time of a file is its last use, so it survives restarts
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[CachedValue]:
+        """
+        Get the nodes stored under a key
+
+        :param key: The cache key
+        :return: The nodes (or course document), or None on a miss
+
+        """
+
+        if key not in self._entries:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                nodes: CachedValue = json.load(cache_file)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Removed by another process or partially written
+            self._forget(key)
+            return None
+
+        self._entries.move_to_end(key)
+
+        return nodes
+
+    def put(self, key: str, nodes: CachedValue) -> None:
+        """
+        Store nodes under a key, then evict the least recently used files until the cache fits in max_bytes
+
+        :param key: The cache key
+        :param nodes: The converted nodes (or course document)
+
+        """
+
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(nodes, cache_file, ensure_ascii=False)
+
+        # The rename is atomic, readers never see a partial file
+        os.replace(temp_path, path)
+
+        self._forget(key)
+        self._entries[key] = os.path.getsize(path)
+        self.total_bytes += self._entries[key]
+
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest_key = next(iter(self._entries))
+            self._forget(oldest_key)
+
+            try:
+                os.remove(self._path(oldest_key))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+
+        if size is not None:
+            self.total_bytes -= size
@@ -0,0 +1,252 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from al_types import AlNode
+
+MAGIC = b"ALNODES1"
+
+# Magic, then the length of the JSON header
+PREFIX = struct.Struct("<8sQ")
+
+Buffer = Union[bytes, memoryview]
+
+
+def align(position: int) -> int:
+    return (position + 7) // 8 * 8
+
+
+class NodeStore:
+    """
+    The nodes of a course in columnar form, much smaller in memory than a list of AlNode dictionaries (pickled, they are
+    about the same size).
+    The texts are one UTF-8 buffer with the offset of each text. Node types and metadata are interned: each distinct
+    value is stored once and the nodes keep its id.
+
+    Indexing and iterating give AlNode dictionaries. Their metadata is shared with the nodes that have the same
+    metadata, and must not be modified.
+
+    """
+
+    __slots__ = ("_buffer", "_offsets", "_node_numbers", "_type_ids", "_types", "_metadata_ids", "_metadata", "_mmap")
+
+    def __init__(
+            self,
+            buffer: Buffer,
+            offsets: Sequence[int],
+            node_numbers: Sequence[int],
+            type_ids: Sequence[int],
+            types: List[str],
+            metadata_ids: Sequence[int],
+            metadata: List[Dict[str, Any]],
+            mapped: Optional[mmap.mmap] = None
+    ):
+        """
+        Use from_nodes or load rather than this constructor.
+
+        :param buffer: The UTF-8 texts, one after the other
+        :param offsets: Start of each text in the buffer, then the end of the last one (int64)
+        :param node_numbers: node_number of each node (int64)
+        :param type_ids: Index of the type of each node in types (uint8)
+        :param types: The distinct node types
+        :param metadata_ids: Index of the metadata of each node in metadata (uint32)
+        :param metadata: The distinct metadata
+        :param mapped: The memory-mapped file the arrays are read from, if any
+
+        """
+
+        self._buffer = buffer
+        self._offsets = offsets
+        self._node_numbers = node_numbers
+        self._type_ids = type_ids
+        self._types = types
+        self._metadata_ids = metadata_ids
+        self._metadata = metadata
+        self._mmap = mapped
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[AlNode]) -> "NodeStore":
+        """
+        :param nodes: AlNode dictionaries, as returned by convert_file
+        :return: The nodes in columnar form
+
+        """
+
+        texts: List[bytes] = []
+        offsets = array("q", [0])
+        node_numbers = array("q")
+        type_ids = array("B")
+        metadata_ids = array("I")
+
+        # Value (as canonical JSON for the metadata) -> id
+        type_index: Dict[str, int] = {}
+        metadata_index: Dict[str, int] = {}
+        metadata: List[Dict[str, Any]] = []
+
+        for node in nodes:
+            text = node["text"].encode("utf-8")
+            texts.append(text)
+            offsets.append(offsets[-1] + len(text))
+            node_numbers.append(node["node_number"])
+            type_ids.append(type_index.setdefault(node["type"], len(type_index)))
+
+            key = json.dumps(node["metadata"], sort_keys=True, ensure_ascii=False)
+            if key not in metadata_index:
+                metadata_index[key] = len(metadata)
+                metadata.append(json.loads(key))
+            metadata_ids.append(metadata_index[key])
+
+        return cls(b"".join(texts), offsets, node_numbers, type_ids, list(type_index), metadata_ids, metadata)
+
+    def __len__(self) -> int:
+        return len(self._node_numbers)
+
+    def text(self, index: int) -> str:
+        return str(self._buffer[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def texts(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self.text(index)
+
+    def __getitem__(self, index: int) -> AlNode:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("NodeStore index out of range")
+
+        return {
+            "node_number": self._node_numbers[index],
+            "type": self._types[self._type_ids[index]],
+            "text": self.text(index),
+            "metadata": self._metadata[self._metadata_ids[index]],
+        }
+
+    def __iter__(self) -> Iterator[AlNode]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getstate__(self) -> tuple:
+        # Memory-mapped stores are pickled with a copy of their arrays
+        return (
+            bytes(self._buffer), array("q", bytes(self._offsets)), array("q", bytes(self._node_numbers)),
+            array("B", bytes(self._type_ids)), self._types, array("I", bytes(self._metadata_ids)), self._metadata,
+        )
+
+    def __setstate__(self, state: tuple) -> None:
+        self.__init__(*state)
+
+    def __repr__(self) -> str:
+        return f"NodeStore({len(self)} nodes, {len(self._buffer)} text bytes, {len(self._metadata)} distinct metadata)"
+
+    def save(self, path: str) -> None:
+        """
+        Write the store to a file that load can memory-map. The arrays and the texts are written as they are in memory,
+        8-byte aligned, after a JSON header with the interned types and metadata. The file is replaced atomically.
+
+        :param path: The file path
+
+        """
+
+        columns = [
+            ("offsets", "q", bytes(self._offsets)),
+            ("node_numbers", "q", bytes(self._node_numbers)),
+            ("metadata_ids", "I", bytes(self._metadata_ids)),
+            ("type_ids", "B", bytes(self._type_ids)),
+            ("texts", "B", bytes(self._buffer)),
+        ]
+
+        # The header gives the position of each column, which depends on the length of the header itself
+        header: Dict[str, Any] = {"count": len(self), "types": self._types, "metadata": self._metadata, "columns": {}}
+        start = 0
+        while True:
+            header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            position = align(PREFIX.size + len(header_bytes))
+            if position == start:
+                break
+
+            start = position
+            for name, typecode, data in columns:
+                header["columns"][name] = [typecode, position, len(data)]
+                position = align(position + len(data))
+
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as store_file:
+            store_file.write(PREFIX.pack(MAGIC, len(header_bytes)) + header_bytes)
+
+            for name, typecode, data in columns:
+                store_file.write(b"\0" * (header["columns"][name][1] - store_file.tell()))
+                store_file.write(data)
+
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "NodeStore":
+        """
+        Memory-map a file written by save. The texts and arrays are not read until they are used, and the pages are
+        shared by the processes that load the same file.
+
+        :param path: The file path
+        :return: The store
+
+        """
+
+        with open(path, "rb") as store_file:
+            mapped = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length = PREFIX.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a node store")
+
+        header = json.loads(mapped[PREFIX.size:PREFIX.size + header_length])
+        view = memoryview(mapped)
+
+        def column(name: str) -> memoryview:
+            typecode, position, length = header["columns"][name]
+            data = view[position:position + length]
+            return data if typecode == "B" else data.cast(typecode)
+
+        return cls(
+            column("texts"), column("offsets"), column("node_numbers"), column("type_ids"), header["types"],
+            column("metadata_ids"), header["metadata"], mapped
+        )
+
+    def to_arrow(self) -> Any:
+        """
+        Export to an Arrow table (pyarrow is imported on first use). The text column is a large_string array over the
+        texts buffer and the offsets, without copying them. Types and metadata (as JSON) are dictionary encoded.
+
+        :return: pyarrow.Table with the columns node_number, type, text and metadata
+
+        """
+
+        import pyarrow as pa
+
+        count = len(self)
+        texts = pa.LargeStringArray.from_buffers(count, pa.py_buffer(self._offsets), pa.py_buffer(self._buffer))
+        types = pa.DictionaryArray.from_arrays(pa.array(self._type_ids, pa.uint8()), pa.array(self._types, pa.string()))
+        metadata = pa.DictionaryArray.from_arrays(
+            pa.array(self._metadata_ids, pa.uint32()),
+            pa.array([json.dumps(value, ensure_ascii=False) for value in self._metadata], pa.string()),
+        )
+
+        return pa.table({
+            "node_number": pa.array(self._node_numbers, pa.int64()),
+            "type": types,
+            "text": texts,
+            "metadata": metadata,
+        })
+
+    def write_parquet(self, path: str) -> None:
+        """
+        Write the store as a Parquet file, see to_arrow for the columns
+
+        :param path: The file path
+
+        """
+
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(), path)
@@ -0,0 +1,115 @@
+import re
+from typing import Dict, List, Sequence, Set, Tuple
+
+from al_types import AlQueryIntent, AlRoutedQuery
+
+# Words that make a query a question, when it starts with one of them
+QUESTION_START = frozenset([
+    "what", "how", "why", "when", "who", "whom", "whose", "which", "where", "does", "is", "are",
+    "can", "could", "will", "would", "should", "may", "might", "have", "must",
+])
+
+# Every intent word, matched anywhere in the lowercased query (like the substring tests it replaces)
+INTENT_PATTERN = re.compile(r"assi\w{1,3}ent|next|upcoming|previo|first|fisrt|last|lasst|today|tody")
+
+# Intent word -> the relation it signals, the misspellings only count for assignments ("fisrt class" is not temporal).
+# The other matches are spellings of "assignment".
+INTENT_WORDS: Dict[str, Tuple[str, bool]] = {
+    "next": ("next", False), "upcoming": ("next", False), "previo": ("previous", False),
+    "first": ("first", False), "fisrt": ("first", True),
+    "last": ("last", False), "lasst": ("last", True),
+    "today": ("today", False), "tody": ("today", True),
+}
+
+# When a query has several relations, the first one in this order wins
+RELATION_ORDER = ("next", "previous", "first", "last", "today")
+
+DONT_KNOW = ("I don't know", "I dont know")
+DONT_KNOW_PATTERN = re.compile(r"I don'?t know")
+
+
+class QueryRouter:
+    """
+    Normalizes the queries of a course and classifies what they ask about (an assignment or a lecture, and the next,
+    previous, first, last or today's one) in a single scan of each query, with patterns compiled once per course.
+
+    """
+
+    def __init__(self, course_number: str = "", course_title: str = ""):
+        """
+        :param course_number: The course rubric and number, replaced by "this course" in queries
+        :param course_title: The course title, replaced by "this course" in queries
+
+        """
+
+        # A query that names the course always selects the Course Information, which is not helpful
+        self.course_names = [name for name in (course_number, course_title) if name]
+
+    def normalize(self, query: str) -> str:
+        """
+        Prepare a student query for retrieval and completion: the course name becomes "this course", a query that starts
+        with "I don't know" (which the LLM has difficulty answering) is rephrased, and a question gets its question mark.
+
+        :param query: The student query
+        :return: The normalized query
+
+        """
+
+        for name in self.course_names:
+            query = query.replace(name, "this course")
+
+        if query.startswith(DONT_KNOW):
+            query = DONT_KNOW_PATTERN.sub("I would like to know", query)
+
+        words = query.split()
+        if words and not query.endswith("?") and words[0].lower() in QUESTION_START:
+            query = query.rstrip() + "?"
+
+        return query
+
+    @staticmethod
+    def classify(query: str) -> AlQueryIntent:
+        """
+        Find what a query asks about
+
+        :param query: The query
+        :return: The subject and the temporal relation of the query
+
+        """
+
+        words = INTENT_PATTERN.findall(query.lower())
+        if not words:
+            return AlQueryIntent("lecture", None)
+
+        is_assignment = any(word not in INTENT_WORDS for word in words)
+        relations: Set[str] = set()
+
+        for word in words:
+            relation, is_misspelling = INTENT_WORDS.get(word, (None, False))
+            if relation is not None and (is_assignment or not is_misspelling):
+                relations.add(relation)
+
+        relation = next((name for name in RELATION_ORDER if name in relations), None)
+
+        return AlQueryIntent("assignment" if is_assignment else "lecture", relation)
+
+    def route(self, query: str) -> AlRoutedQuery:
+        query = self.normalize(query)
+        return AlRoutedQuery(query, self.classify(query))
+
+    def route_many(self, queries: Sequence[str]) -> List[AlRoutedQuery]:
+        """
+        Normalize and classify a batch of queries, such as a question bank. Repeated queries are only routed once.
+
+        :param queries: The student queries
+        :return: The normalized query and the intent of each query, in input order
+
+        """
+
+        routed: Dict[str, AlRoutedQuery] = {}
+
+        for query in queries:
+            if query not in routed:
+                routed[query] = self.route(query)
+
+        return [routed[query] for query in queries]
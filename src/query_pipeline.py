@@ -0,0 +1,415 @@
+import asyncio
+import os
+import random
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import cohere
+import httpx
+from openai import APIConnectionError, AsyncAzureOpenAI
+
+from al_types import AlAnswer
+from bm25_index import Bm25Index, node_text
+from metrics import CompletionObserver, CompletionTimer
+from node_store import NodeStore
+from retrieval_cache import RetrievalCache, RetrievalResult, candidate_set_key, node_set_key
+
+AZURE_ENDPOINT = "https://cria-dev-useast.openai.azure.com"
+# The first GA version that sends the token usage of streamed completions (stream_options)
+AZURE_API_VERSION = "2024-10-21"
+
+# Seconds allowed to each remote stage of a query
+DEFAULT_TIMEOUTS: Dict[str, float] = {"retrieval": 10.0, "completion": 60.0}
+
+# HTTP statuses of rate limits and transient provider errors
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def retry_delay(error: Exception, attempt: int, backoff: float) -> Optional[float]:
+    """
+    How long to wait before retrying a stage that failed.
+    Rate limits wait what the provider asks in Retry-After, otherwise the delay doubles with each attempt, with jitter.
+
+    :param error: The error of the stage
+    :param attempt: Index of the failed attempt, 0 for the first one
+    :param backoff: Delay of the first retry, in seconds
+    :return: Seconds to wait, None when the error is not worth retrying
+
+    """
+
+    if not isinstance(error, (asyncio.TimeoutError, httpx.TransportError, APIConnectionError)):
+        if getattr(error, "status_code", None) not in RETRYABLE_STATUS:
+            return None
+
+        # Cohere errors carry the headers, OpenAI errors the response
+        headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        try:
+            return max(float(retry_after), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    return backoff * 2 ** attempt * (1 + random.random())
+
+
+def prompt_context(node: Any) -> str:
+    """
+    The context given to construct_prompt for a retrieved node
+
+    :param node: A node text or AlNode dictionary
+    :return: The node text, after the name of its source document when it has one (see course_registry.merge_documents)
+
+    """
+
+    source = node["metadata"].get("source") if isinstance(node, dict) else None
+
+    return "From " + source + ":\n" + node_text(node) if source else node_text(node)
+
+
+class ProviderClients:
+    """
+    Long-lived async Cohere and Azure OpenAI clients, shared by every query of the process.
+    Their connections are pooled and kept alive, instead of a new client (and TLS handshake) for each call.
+
+    """
+
+    def __init__(
+            self,
+            cohere_api_key: Optional[str] = None,
+            openai_api_key: Optional[str] = None,
+            azure_endpoint: str = AZURE_ENDPOINT,
+            api_version: str = AZURE_API_VERSION,
+            cohere_base_url: Optional[str] = None,
+            max_connections: int = 64,
+            max_retries: int = 0
+    ):
+        """
+        :param cohere_api_key: Defaults to the COHERE_DEV environment variable
+        :param openai_api_key: Defaults to the OPENAI_API_KEY environment variable
+        :param azure_endpoint: Azure OpenAI resource endpoint
+        :param api_version: Azure OpenAI API version
+        :param cohere_base_url: Cohere API url, the production API by default
+        :param max_connections: Size of the Cohere connection pool, all of them are kept alive between requests
+        :param max_retries: Retries of the SDK clients themselves, keep 0 when QueryPipeline retries (see its max_retries)
+
+        """
+
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        # Both SDKs retry by default. Those retries would run underneath QueryPipeline's, which would then not see the
+        # rate limits, and the attempts would multiply
+        self.cohere = cohere.AsyncClient(
+            cohere_api_key or os.getenv('COHERE_DEV'),
+            base_url=cohere_base_url,
+            max_retries=max_retries,
+            httpx_client=self.http_client,
+        )
+        # The OpenAI client pools and keeps its connections alive itself
+        self.openai = AsyncAzureOpenAI(
+            api_key=openai_api_key or os.getenv('OPENAI_API_KEY'),
+            api_version=api_version,
+            azure_endpoint=azure_endpoint,
+            max_retries=max_retries,
+        )
+
+    async def aclose(self) -> None:
+        await self.openai.close()
+        await self.http_client.aclose()
+
+    async def __aenter__(self) -> "ProviderClients":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+
+class QueryPipeline:
+    """
+    Answers queries against the nodes of a course: pre-processing -> retrieval (BM25 shortlist and Cohere rerank)
+    -> prompt construction -> chat completion.
+    Queries run concurrently up to a limit, the remote stages are awaited with a timeout each.
+    answer_stream yields the answer as it is generated. The latency and token counts of every completion go to the observer.
+
+    """
+
+    def __init__(
+            self,
+            nodes: Sequence[Any],
+            clients: ProviderClients,
+            pre_process: Callable[[str], str],
+            construct_prompt: Callable[[str, str], str],
+            bm25_index: Optional[Bm25Index] = None,
+            retrieval_cache: Optional[RetrievalCache] = None,
+            concurrency: int = 16,
+            timeouts: Optional[Dict[str, float]] = None,
+            shortlist_size: int = 10,
+            rerank_model: str = "rerank-english-v3.0",
+            deployment_name: str = "cria-gpt-4o-mini",
+            max_tokens: int = 4000,
+            temperature: float = 1.0,
+            max_retries: int = 0,
+            retry_backoff: float = 1.0,
+            observer: Optional[CompletionObserver] = None,
+            nodes_key: Optional[str] = None
+    ):
+        """
+        :param nodes: The sorted nodes of the course (texts, AlNode dictionaries or a NodeStore), indexed without a copy
+        :param clients: The shared provider clients
+        :param pre_process: Takes the student query and returns the query to retrieve and answer
+        :param construct_prompt: Takes the query and the prompt context (see prompt_context) and returns the prompt
+        :param bm25_index: Index of the nodes, only its shortlist is sent to the reranker. Without it, all the nodes are
+        :param retrieval_cache: Optional cache of the retrieval results
+        :param concurrency: Maximum number of queries in progress, the others wait for a slot
+        :param timeouts: Seconds allowed to the "retrieval" and "completion" stages, see DEFAULT_TIMEOUTS
+        :param shortlist_size: Number of BM25 candidates sent to the reranker
+        :param rerank_model: Cohere rerank model
+        :param deployment_name: Azure OpenAI deployment of the chat model
+        :param max_tokens: Maximum completion tokens
+        :param temperature: Completion temperature
+        :param max_retries: Retries of a stage that timed out, was rate limited or hit a transient provider error
+        :param retry_backoff: Seconds before the first retry, see retry_delay
+        :param observer: Receives the metrics of each chat completion, see metrics.PrometheusCompletionExporter
+        :param nodes_key: node_set_key of the nodes when it is already known (e.g. Course.nodes_key), computed otherwise
+
+        """
+
+        self.nodes = nodes
+        self.nodes_key = nodes_key if nodes_key is not None else node_set_key(self.nodes)
+        self.clients = clients
+        self.pre_process = pre_process
+        self.construct_prompt = construct_prompt
+        self.bm25_index = bm25_index
+        self.retrieval_cache = retrieval_cache
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.shortlist_size = shortlist_size
+        self.rerank_model = rerank_model
+        self.deployment_name = deployment_name
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retries = 0  # Number of stage retries so far
+        self.observer = observer
+
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def node_text(self, index: int) -> str:
+        # A NodeStore gives the text without building the node dictionary
+        return self.nodes.text(index) if isinstance(self.nodes, NodeStore) else node_text(self.nodes[index])
+
+    async def retrieve(self, query: str, candidates: Optional[Sequence[int]] = None) -> RetrievalResult:
+        """
+        Find the node that best answers the query
+
+        :param query: The pre-processed query
+        :param candidates: Indices of the nodes to rerank, by default the BM25 shortlist
+        :return: The relevance score, the prompt context of the node and its index
+
+        """
+
+        # Results reranked from other candidates (given ones, or the BM25 shortlist) are not reused
+        candidates_key = candidate_set_key(candidates, self.shortlist_size if self.bm25_index is not None else None)
+
+        if self.retrieval_cache is not None:
+            cached_result = self.retrieval_cache.get(query, self.nodes_key, candidates_key)
+            if cached_result is not None:
+                return cached_result
+
+        if candidates is not None:
+            candidates = list(candidates)
+        elif self.bm25_index is not None:
+            candidates = self.bm25_index.shortlist(query, self.shortlist_size)
+        else:
+            candidates = list(range(len(self.nodes)))
+
+        response = await self.clients.cohere.rerank(
+            model=self.rerank_model,
+            query=query,
+            documents=[self.node_text(candidate) for candidate in candidates],
+            top_n=3,
+        )
+
+        best = response.results[0]
+        index = candidates[best.index]  # index in the shortlist -> index in the nodes
+        result = (best.relevance_score, prompt_context(self.nodes[index]), index)
+
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.put(query, self.nodes_key, result, candidates_key)
+
+        return result
+
+    async def complete(self, prompt: str) -> str:
+        """
+        Run the chat completion of a prompt
+
+        :param prompt: The prompt
+        :return: The answer
+
+        """
+
+        timer = CompletionTimer(self.deployment_name, streamed=False)
+
+        response = await self.clients.openai.chat.completions.create(
+            model=self.deployment_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+        )
+
+        content = response.choices[0].message.content
+        if content:
+            timer.token()
+        timer.finish(self.observer, response.usage)
+
+        return content
+
+    async def stream_completion(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Run the chat completion of a prompt and yield its content as it arrives.
+        Opening the stream is retried like the other stages (see run_stage), a rate limit waits its Retry-After. The
+        completion timeout bounds the wait for each chunk, not the whole answer.
+
+        :param prompt: The prompt
+        :return: The pieces of the answer
+
+        """
+
+        timer = CompletionTimer(self.deployment_name, streamed=True)
+        timeout = self.timeouts["completion"]
+        usage = None
+
+        stream = await self.run_stage("completion", lambda: self.clients.openai.chat.completions.create(
+            model=self.deployment_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True,
+            stream_options={"include_usage": True},  # the usage comes in a last chunk, without choices
+        ))
+
+        try:
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+
+                # Azure also sends its content filter results in chunks without choices
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    timer.token()
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+        timer.finish(self.observer, usage)
+
+    async def run_stage(self, stage: str, start: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await a remote stage with its timeout, retrying it when retry_delay allows
+
+        :param stage: "retrieval" or "completion"
+        :param start: Starts a new attempt of the stage
+        :return: The result of the stage
+
+        """
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.wait_for(start(), self.timeouts[stage])
+            except Exception as e:
+                delay = retry_delay(e, attempt, self.retry_backoff)
+                if delay is None or attempt == self.max_retries:
+                    raise
+
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def answer(self, query: str, candidates: Optional[Sequence[int]] = None) -> AlAnswer:
+        """
+        Answer one query. A stage that still fails after its retries is reported in "error" and does not raise.
+
+        :param query: The student query
+        :param candidates: Indices of the nodes to rerank, by default the BM25 shortlist
+        :return: The answer and how it was found
+
+        """
+
+        result: AlAnswer = {
+            "query": query,
+            "relevance_score": None,
+            "index": None,
+            "prompt_context": None,
+            "answer": None,
+            "error": None,
+        }
+
+        async with self._slots:
+            stage = "pre_process"
+            try:
+                result["query"] = query = self.pre_process(query)
+
+                stage = "retrieval"
+                relevance_score, prompt_context, index = await self.run_stage(stage, lambda: self.retrieve(query, candidates))
+                result.update(relevance_score=relevance_score, prompt_context=prompt_context, index=index)
+
+                stage = "construct_prompt"
+                prompt = self.construct_prompt(query, prompt_context)
+
+                stage = "completion"
+                result["answer"] = await self.run_stage(stage, lambda: self.complete(prompt))
+
+            except Exception as e:
+                result["error"] = f"{stage}: {type(e).__name__}: {e}"
+
+        return result
+
+    async def answer_stream(self, query: str, candidates: Optional[Sequence[int]] = None) -> AsyncIterator[str]:
+        """
+        Answer one query, yielding the answer as it is generated. Unlike answer, errors are raised.
+        The concurrency slot is released when the first piece arrives, so that a slow reader does not hold it.
+
+        :param query: The student query
+        :param candidates: Indices of the nodes to rerank, by default the BM25 shortlist
+        :return: The pieces of the answer
+
+        """
+
+        async with self._slots:
+            query = self.pre_process(query)
+            relevance_score, prompt_context, index = await self.run_stage("retrieval", lambda: self.retrieve(query, candidates))
+
+            tokens = self.stream_completion(self.construct_prompt(query, prompt_context))
+            try:
+                token = await tokens.__anext__()
+            except StopAsyncIteration:
+                return
+
+        try:
+            yield token
+            async for token in tokens:
+                yield token
+        finally:
+            await tokens.aclose()
+
+    async def answer_many(
+            self,
+            queries: Sequence[str],
+            candidate_lists: Optional[Sequence[Optional[Sequence[int]]]] = None
+    ) -> List[AlAnswer]:
+        """
+        Answer queries concurrently, within the concurrency limit
+
+        :param queries: The student queries
+        :param candidate_lists: Optional candidates of each query, see answer
+        :return: One answer per query, in input order
+
+        """
+
+        if candidate_lists is None:
+            candidate_lists = [None] * len(queries)
+
+        return list(await asyncio.gather(*(self.answer(query, candidates) for query, candidates in zip(queries, candidate_lists))))
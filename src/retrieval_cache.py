@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence, Tuple
+
+# (relevance score, prompt context, node index), as returned by QueryPipeline.retrieve
+RetrievalResult = Tuple[float, str, int]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a (pre-processed) query for the cache key: case and runs of whitespace are ignored
+
+    :param query: The query
+    :return: The normalized query
+
+    """
+
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+def node_set_key(nodes: Sequence[Any]) -> str:
+    """
+    Hash of the nodes a query is run against, a re-conversion that changes the nodes changes the key
+
+    :param nodes: Nodes texts or AlNode dictionaries
+    :return: Hexadecimal key
+
+    """
+
+    return hashlib.sha256(json.dumps(list(nodes), sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def candidate_set_key(candidates: Optional[Sequence[int]] = None, shortlist_size: Optional[int] = None) -> str:
+    """
+    Describes the nodes a query is reranked against, so that results obtained with other candidates are not reused
+
+    :param candidates: The given candidates (e.g. from the vector index), if any
+    :param shortlist_size: Size of the BM25 shortlist used without given candidates, None when all the nodes are reranked
+    :return: Key part
+
+    """
+
+    if candidates is not None:
+        return "nodes=" + ",".join(str(candidate) for candidate in candidates)
+
+    return "all" if shortlist_size is None else f"bm25={shortlist_size}"
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results with a time to live, keyed by the normalized query, the hash of the node set and the
+    candidates that were reranked.
+    It can be persisted to a JSON file.
+
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 24 * 3600, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+        # Key -> (expiry as a Unix time, result), from least to most recently used
+        self._entries: OrderedDict[str, Tuple[float, RetrievalResult]] = OrderedDict()
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def key(query: str, nodes_key: str, candidates_key: str = "all") -> str:
+        return nodes_key + ":" + candidates_key + ":" + normalize_query(query)
+
+    def get(self, query: str, nodes_key: str, candidates_key: str = "all") -> Optional[RetrievalResult]:
+        """
+        Get the cached result of a query
+
+        :param query: The pre-processed query
+        :param nodes_key: node_set_key of the nodes
+        :param candidates_key: candidate_set_key of the reranked nodes
+        :return: The result, or None on a miss (or when it expired)
+
+        """
+
+        key = self.key(query, nodes_key, candidates_key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+    def put(self, query: str, nodes_key: str, result: RetrievalResult, candidates_key: str = "all") -> None:
+        with self._lock:
+            key = self.key(query, nodes_key, candidates_key)
+            self._entries[key] = (time.time() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def load(self) -> None:
+        """
+        Load the entries saved in path, the expired ones are dropped
+
+        """
+
+        with open(self.path, "r", encoding="utf-8") as json_file:
+            saved = json.load(json_file)
+
+        now = time.time()
+        with self._lock:
+            for key, expiry, result in saved:
+                if expiry >= now:
+                    self._entries[key] = (expiry, tuple(result))
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self) -> None:
+        """
+        Save the entries to path, atomically
+
+        """
+
+        with self._lock:
+            saved = [[key, expiry, list(result)] for key, (expiry, result) in self._entries.items()]
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as json_file:
+            json.dump(saved, json_file, ensure_ascii=False)
+
+        os.replace(temp_path, self.path)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+
+        return self.hits / total if total else 0.0
@@ -0,0 +1,237 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional
+
+from bm25_index import tokenize
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the Cohere rerank and the Azure OpenAI chat completions endpoints.
+    Connections are kept alive (HTTP/1.1), like the real providers.
+
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "StubProviderServer"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_events(self, events: Iterator[Dict[str, Any]]) -> None:
+        """
+        Send server-sent events in a chunked response, ended by the "[DONE]" event of the OpenAI streaming API
+
+        """
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for event in events:
+            self.write_chunk(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        requests = self.server.count("requests")
+
+        rate_limit_every = self.server.rate_limit_every
+        if rate_limit_every and requests % rate_limit_every == 0:
+            self.send_json(429, {"message": "Rate limit exceeded"}, {"Retry-After": "0"})
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.path.split("?")[0].endswith("/rerank"):
+            self.send_json(200, self.server.rerank(request))
+        elif "/chat/completions" in self.path and request.get("stream"):
+            self.send_events(self.server.chat_completion_chunks(request))
+        elif "/chat/completions" in self.path:
+            self.send_json(200, self.server.chat_completion(request))
+        else:
+            self.send_json(404, {"message": f"No stub for {self.path}"})
+
+
+class StubProviderServer(ThreadingHTTPServer):
+    """
+    Local HTTP server standing in for Cohere and Azure OpenAI, so that the query pipeline can be tested and benchmarked
+    without keys or network. Each request runs in its own thread and waits `latency` seconds, like a remote call.
+    With `rate_limit_every` set to n, every nth request is refused with a 429, to exercise the retries.
+    Streamed completions send one word per chunk, `token_latency` seconds apart.
+
+    Point cohere.AsyncClient(base_url=server.url) and AsyncAzureOpenAI(azure_endpoint=server.url) at it.
+
+    """
+
+    daemon_threads = True
+    request_queue_size = 128  # Many clients connect at once under concurrent queries
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            answer: Optional[str] = None,
+            rate_limit_every: int = 0,
+            token_latency: float = 0.0,
+            host: str = "127.0.0.1",
+            port: int = 0
+    ):
+        super().__init__((host, port), StubProviderHandler)
+        self.latency = latency
+        self.answer = answer
+        self.rate_limit_every = rate_limit_every
+        self.token_latency = token_latency
+        self.counts = {"connections": 0, "requests": 0}
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            self.counts[name] += 1
+            return self.counts[name]
+
+    def rerank(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Scores the documents by the share of the query terms they contain
+
+        :param request: Cohere rerank request (query, documents, top_n)
+        :return: Cohere rerank response
+
+        """
+
+        query_terms = set(tokenize(request["query"]))
+        scores = []
+        for index, document in enumerate(request["documents"]):
+            text = document if isinstance(document, str) else document.get("text", "")
+            shared = len(query_terms & set(tokenize(text)))
+            scores.append((shared / len(query_terms) if query_terms else 0.0, index))
+
+        scores.sort(key=lambda score: (-score[0], score[1]))
+        top_n = request.get("top_n") or len(scores)
+
+        return {
+            "id": "stub-rerank",
+            "results": [{"index": index, "relevance_score": score} for score, index in scores[:top_n]],
+            "meta": {"api_version": {"version": "1"}},
+        }
+
+    def chat_completion(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Answers with the fixed answer, or with the question found at the end of the prompt
+
+        :param request: Chat completions request
+        :return: Chat completions response
+
+        """
+
+        prompt = request["messages"][-1]["content"]
+        answer = self.answer_to(prompt)
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(answer.split())
+
+        return {
+            "id": "stub-completion",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def chat_completion_chunks(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the answer of chat_completion one word at a time, then its usage when the request asks for it
+
+        :param request: Chat completions request with "stream": true
+        :return: Chat completion chunks
+
+        """
+
+        prompt = request["messages"][-1]["content"]
+        answer = self.answer_to(prompt)
+        created = int(time.time())
+
+        for word in answer.split(" "):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+
+            yield {
+                "id": "stub-completion",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": word + " "}, "finish_reason": None}],
+            }
+
+        if (request.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens = len(prompt.split())
+            completion_tokens = len(answer.split())
+
+            yield {
+                "id": "stub-completion",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.get("model", "stub"),
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+
+    def answer_to(self, prompt: str) -> str:
+        if self.answer is not None:
+            return self.answer
+
+        return "Stub answer to: " + prompt.rsplit("Question: ", 1)[-1].replace("\n\nAnswer:", "").strip()
+
+    def start(self) -> "StubProviderServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubProviderServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
@@ -0,0 +1,236 @@
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from al_types import AlTableTemplate, AlTextTable
+
+# Starts every rendered row, so that a long table is split into chunks between its rows. conversions.chunk_node
+# removes it from the nodes
+ROW_SEPARATOR = "\x1e"
+
+# A compiled row part: (condition on the row or None, template when true or unconditional, template when false)
+RowPart = Tuple[Optional[Callable[[Tuple[str, ...]], bool]], Callable[..., str], Callable[..., str]]
+
+BUILTIN_TEMPLATES: List[AlTableTemplate] = [
+    {
+        "title": "Tutorials",
+        "intro": (
+            "Who your TA is and what your TA's email is, and what your tutorial time and day, "
+            "your tutorial room, and your tutorial Zoom address are depends on which tutorial "
+            "your are in. If the tutorial information is not provided, please always provide "
+            "a conditional answer that includes all possibilities. Example of a proper answer: "
+            "'if you are in Tutorial 1, your TA is...; if you are in Tutorial 2, your TA is...; "
+            "if you are in Tutorial 3, your TA is...'. \n "
+        ),
+        "row": [
+            "If you are in Tutorial {0}, your TA (or teaching assistant or tutor or responsible instructor who teaches the tutorial) is {1}.\n ",
+            "If you are in Tutorial {0}, your tutorial time is {2}.\n ",
+            "If you are in Tutorial {0}, your tutorial room is {3}.\n ",
+            "If you are in Tutorial {0}, your Zoom address (or Zoom link) during online sessions is {4} .\n",
+        ],
+    },
+    {
+        "title": "Faculty Members Information",
+        "match": "contains",
+        "row": [
+            "{0} is the course's {1} and has the following email address: {2} and has the following office hours "
+            "(time you can meet or appointment time): {3} and has the following office address or location "
+            "(where you can meet with your professor or instructor or teacher or TA): {4}.\n ",
+        ],
+    },
+    {
+        "title": "Summary of Evaluation",
+        "intro": (
+            "This section answers questions about how much an assignment is worth (how much it counts toward the final grade) "
+            "and when the assignments are due or have to be submitted or handed in (submission date). \n"
+        ),
+        "row": [
+            "The {0} is worth {1} of the final grade. In other words, it counts for {1} of the final grade.\n ",
+            "The {0} is due on {2}. In other words, the deadline or due date or submission date for {0} is {2}.\n ",
+        ],
+    },
+    {
+        "title": "Grading Equivalence",
+        "row": [
+            "{0} is the same as a grade point of {1}, which falls in the percent range of {2}%, and is described as '{3}'.\n ",
+        ],
+    },
+    {
+        "title": "Definitions of Standing",
+        "include_header": True,
+        "row": [
+            "A grade considered '{0}' means that you have a {1}\n ",
+        ],
+    },
+    {
+        "title": "Schedule and Readings",
+        "row": [
+            "The topic on {2} is (or is about) '{0}'. In other words, '{0}' is presented in class on {2}.\n ",
+            {
+                "if_empty": 1,
+                "then": "There are no readings on {2}.\n ",
+                "else": "The reading(s) for the topic called '{0}' on {2} is (are) the following: {1}\n ",
+            },
+        ],
+    },
+    {
+        "title": "Important Dates",
+        "row": [
+            {
+                "if_contains": [1, "None"],
+                "then": "There is no {0}.\n ",
+                "else": "{0} is on {1}.\n ",
+            },
+        ],
+    },
+]
+
+
+def compile_part(part: Union[str, Dict[str, Any]]) -> RowPart:
+    """
+    Compile one part of a row template
+
+    :param part: A template string or a condition
+    :return: The compiled part
+
+    """
+
+    if isinstance(part, str):
+        return None, part.format, part.format
+
+    if "if_empty" in part:
+        column = part["if_empty"]
+        condition = lambda row: not row[column]  # noqa: E731
+
+    elif "if_contains" in part:
+        column, text = part["if_contains"]
+        condition = lambda row: text in row[column]  # noqa: E731
+
+    else:
+        raise ValueError(f"Unknown row part {part!r}, expected a template, 'if_empty' or 'if_contains'")
+
+    return condition, part["then"].format, part["else"].format
+
+
+class TableTemplate:
+    """
+    A table template compiled once, renders a table in one pass over its rows
+
+    """
+
+    def __init__(self, spec: AlTableTemplate):
+        self.title = spec["title"]
+        self.match = spec.get("match", "exact")
+        self.include_header = spec.get("include_header", False)
+        self.head = "*" + self.title + "*\n " + spec.get("intro", "")
+        self.parts = [compile_part(part) for part in spec["row"]]
+
+        if self.match not in ("exact", "contains"):
+            raise ValueError(f"Unknown match {self.match!r} for the template {self.title!r}")
+
+    def render(self, table: AlTextTable) -> str:
+        rows = (table.header,) + table.rows if self.include_header else table.rows
+        pieces = [self.head]
+
+        for row in rows:
+            pieces.append(ROW_SEPARATOR)
+            for condition, then_format, else_format in self.parts:
+                pieces.append(then_format(*row) if condition is None or condition(row) else else_format(*row))
+
+        return "".join(pieces)
+
+
+def render_generic(table: AlTextTable) -> str:
+    """
+    Render a table that has no template, each row gives the value of every column once
+
+    :param table: The table
+    :return: Node text
+
+    """
+
+    labels = ["the following " + name.lower() + ": " for name in table.header]
+    pieces = ["*" + table.title + "*\n "]
+
+    for row in table.rows:
+        pieces.append(
+            ROW_SEPARATOR + "The following " + table.header[0].lower() + ": " + row[0].strip() + " has " +
+            " and has ".join(labels[k] + row[k].strip() for k in range(1, len(table.header))) + ".\n "
+        )
+
+    return "".join(pieces)
+
+
+class TableTemplates:
+    """
+    Registry of table templates keyed by table title, the tables without a template are rendered by render_generic
+
+    """
+
+    def __init__(self, specs: Sequence[AlTableTemplate]):
+        self.specs = list(specs)
+        self.exact: Dict[str, TableTemplate] = {}
+        self.contains: List[TableTemplate] = []
+
+        for spec in self.specs:
+            template = TableTemplate(spec)
+
+            if template.match == "exact":
+                self.exact[template.title] = template
+            else:
+                self.contains.append(template)
+
+        self.fingerprint = hashlib.sha256(json.dumps(self.specs, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def find(self, title: str) -> Optional[TableTemplate]:
+        template = self.exact.get(title)
+
+        if template is None:
+            template = next((template for template in self.contains if template.title in title), None)
+
+        return template
+
+    def render(self, table: AlTextTable) -> str:
+        """
+        Render a table with the template of its title
+
+        :param table: The table
+        :return: Node text
+
+        """
+
+        template = self.find(table.title)
+
+        return template.render(table) if template is not None else render_generic(table)
+
+    def extend(self, specs: Sequence[AlTableTemplate]) -> "TableTemplates":
+        """
+        A new registry with more templates, a template replaces the one with the same title
+
+        :param specs: The templates to add
+        :return: The new registry
+
+        """
+
+        titles = {spec["title"] for spec in specs}
+
+        return TableTemplates([spec for spec in self.specs if spec["title"] not in titles] + list(specs))
+
+
+DEFAULT_TEMPLATES = TableTemplates(BUILTIN_TEMPLATES)
+
+
+def load_templates(path: str, base: Optional[TableTemplates] = DEFAULT_TEMPLATES) -> TableTemplates:
+    """
+    Load the table templates of an institution from a JSON file containing a list of templates
+
+    :param path: Path of the JSON file
+    :param base: Registry the templates are added to (replacing the ones with the same title), None to start empty
+    :return: The registry
+
+    """
+
+    with open(path, "r", encoding="utf-8") as json_file:
+        specs: List[AlTableTemplate] = json.load(json_file)
+
+    return base.extend(specs) if base is not None else TableTemplates(specs)
@@ -0,0 +1,145 @@
+import re
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from al_types import AlEvent, AlTextTable
+
+# Table title -> kind of its events and the columns of the title, the detail and the date (see BUILTIN_TEMPLATES)
+EVENT_TABLES: Dict[str, Tuple[str, int, int, int]] = {
+    "Summary of Evaluation": ("assignment", 0, 1, 2),
+    "Schedule and Readings": ("lecture", 0, 1, 2),
+}
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+# "Nov 4, 2023", "Sept 5, 2024", "November 30 2023". The weekday before the month, if any, is ignored
+DATE_PATTERN = re.compile(r"\b(" + "|".join(MONTHS) + r")[a-z]*\.?\s+(\d{1,2}),?\s+(\d{4})\b", re.IGNORECASE)
+
+
+def parse_date(text: str) -> Optional[date]:
+    """
+    Find the first date written as month, day and year in a cell
+
+    :param text: The cell text
+    :return: The date, None when the cell has no complete date ("Ongoing", "TBD", "Oct 12-18")
+
+    """
+
+    match = DATE_PATTERN.search(text)
+    if match is None:
+        return None
+
+    month, day, year = match.groups()
+    try:
+        return date(int(year), MONTHS.index(month[:3].lower()) + 1, int(day))
+    except ValueError:
+        return None
+
+
+def read_events(doc_tables: Sequence[AlTextTable]) -> Dict[str, List[AlEvent]]:
+    """
+    Read the dated rows of the evaluation and schedule tables as events
+
+    :param doc_tables: The tables, as returned by read_tables
+    :return: Events by table title, in row order. Rows without a date are left out
+
+    """
+
+    events: Dict[str, List[AlEvent]] = {}
+
+    for table in doc_tables:
+        if table.title not in EVENT_TABLES:
+            continue
+
+        kind, title_column, detail_column, date_column = EVENT_TABLES[table.title]
+        width = max(title_column, detail_column, date_column) + 1
+
+        for row in table.rows:
+            if len(row) < width:
+                continue
+
+            event_date = parse_date(row[date_column])
+            if event_date is None:
+                continue
+
+            events.setdefault(table.title, []).append({
+                "date": event_date.isoformat(),
+                "kind": kind,
+                "title": row[title_column].strip(),
+                "detail": row[detail_column].strip(),
+                "date_text": row[date_column].strip(),
+            })
+
+    return events
+
+
+class Timeline:
+    """
+    The assignments and lectures of a course sorted by date, built once per conversion from the "events" metadata of
+    the nodes. Every lookup is a binary search.
+
+    """
+
+    def __init__(self, events: Iterable[AlEvent]):
+        # Kind -> events sorted by date (rows with the same date keep the table order), and their ISO dates
+        self._events: Dict[str, List[AlEvent]] = {}
+        self._dates: Dict[str, List[str]] = {}
+
+        for event in sorted(events, key=lambda event: event["date"]):
+            self._events.setdefault(event["kind"], []).append(event)
+
+        for kind, kind_events in self._events.items():
+            self._dates[kind] = [event["date"] for event in kind_events]
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[Any]) -> "Timeline":
+        """
+        :param nodes: AlNode dictionaries, as returned by convert_file
+        :return: The timeline of the events stored in the nodes metadata
+
+        """
+
+        return cls(event for node in nodes for event in node["metadata"].get("events", ()))
+
+    def events(self, kind: str) -> List[AlEvent]:
+        return list(self._events.get(kind, ()))
+
+    def next(self, kind: str, today: date) -> Optional[AlEvent]:
+        """
+        :return: The first event after today, None when there is none
+
+        """
+
+        dates = self._dates.get(kind, [])
+        index = bisect_right(dates, today.isoformat())
+
+        return self._events[kind][index] if index < len(dates) else None
+
+    def previous(self, kind: str, today: date) -> Optional[AlEvent]:
+        """
+        :return: The last event on or before today (an event of today is already past), None when there is none
+
+        """
+
+        dates = self._dates.get(kind, [])
+        index = bisect_right(dates, today.isoformat())
+
+        return self._events[kind][index - 1] if index > 0 else None
+
+    def on(self, kind: str, day: date) -> List[AlEvent]:
+        """
+        :return: The events of the day, in table order
+
+        """
+
+        dates = self._dates.get(kind, [])
+        iso_day = day.isoformat()
+
+        return self._events.get(kind, [])[bisect_left(dates, iso_day):bisect_right(dates, iso_day)]
+
+    def first(self, kind: str) -> Optional[AlEvent]:
+        return self._events[kind][0] if self._events.get(kind) else None
+
+    def last(self, kind: str) -> Optional[AlEvent]:
+        return self._events[kind][-1] if self._events.get(kind) else None
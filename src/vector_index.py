@@ -0,0 +1,174 @@
+import hashlib
+import os
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bm25_index import node_text, tokenize
+
+# Takes a batch of texts and returns their embeddings as a (number of texts, dimension) matrix
+Embedder = Callable[[List[str]], np.ndarray]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scale each row to unit length, so that dot products are cosine similarities
+
+    :param matrix: The embeddings
+    :return: float32 matrix with unit rows (zero rows stay zero)
+
+    """
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder: each term of the BM25 tokenizer is hashed to a dimension and a sign.
+    It needs no model or network, which makes it suitable for tests and offline runs.
+
+    """
+
+    def __init__(self, dimension: int = 512):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                # hashlib rather than hash(), which changes between processes
+                digest = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+                matrix[row, digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+
+        return matrix
+
+
+class OpenAIEmbedder:
+    """
+    Embedder backed by an OpenAI (or Azure OpenAI) client, texts are sent in batches
+
+    """
+
+    def __init__(self, client: Any, model: str, batch_size: int = 256):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.name = model
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        rows: List[List[float]] = []
+
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(model=self.model, input=texts[start:start + self.batch_size])
+            rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+
+        return np.asarray(rows, dtype=np.float32)
+
+
+class VectorIndex:
+    """
+    The embeddings of the nodes of a course as one contiguous float32 matrix with unit rows
+
+    """
+
+    def __init__(self, matrix: np.ndarray, embedder: Embedder):
+        self.matrix = matrix
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, nodes: Sequence[Any], embedder: Embedder) -> "VectorIndex":
+        """
+        Embed the nodes, usually once after the conversion
+
+        :param nodes: Nodes texts or AlNode dictionaries, the index of a node in this list is its id in the results
+        :param embedder: The embedder
+        :return: The index
+
+        """
+
+        return cls(normalize_rows(embedder([node_text(node) for node in nodes])), embedder)
+
+    def search(self, queries: List[str], k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+        The k nodes most similar to each query, for a batch of queries at once
+
+        :param queries: The queries
+        :param k: Number of results per query
+        :return: For each query, up to k (node index, cosine similarity), best first
+
+        """
+
+        if not queries or not len(self.matrix):
+            return [[] for _ in queries]
+
+        scores = normalize_rows(self.embedder(queries)) @ self.matrix.T
+        k = min(k, scores.shape[1])
+
+        # Unordered top k of each row, then sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [(int(index), float(score)) for index, score in zip(indices, row_scores)]
+            for indices, row_scores in zip(top, top_scores)
+        ]
+
+
+class EmbeddingStore:
+    """
+    On-disk store of node embeddings, one .npy file per node set and embedder, loaded memory-mapped
+
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, nodes_key: str, embedder: Embedder) -> str:
+        name = getattr(embedder, "name", type(embedder).__name__)
+
+        return os.path.join(self.directory, f"{nodes_key[:32]}-{name}.npy")
+
+    def load(self, nodes_key: str, embedder: Embedder) -> Optional[VectorIndex]:
+        path = self._path(nodes_key, embedder)
+
+        if not os.path.exists(path):
+            return None
+
+        return VectorIndex(np.load(path, mmap_mode="r"), embedder)
+
+    def save(self, nodes_key: str, index: VectorIndex) -> None:
+        path = self._path(nodes_key, index.embedder)
+        temp_path = f"{path}.{os.getpid()}.tmp.npy"
+
+        np.save(temp_path, index.matrix)
+        os.replace(temp_path, path)
+
+    def get_or_build(self, nodes_key: str, nodes: Sequence[Any], embedder: Embedder) -> VectorIndex:
+        """
+        The stored index of a node set, built and stored on first use
+
+        :param nodes_key: retrieval_cache.node_set_key of the nodes
+        :param nodes: Nodes texts or AlNode dictionaries
+        :param embedder: The embedder
+        :return: The index, memory-mapped when it was stored before
+
+        """
+
+        index = self.load(nodes_key, embedder)
+
+        if index is None:
+            index = VectorIndex.build(nodes, embedder)
+            self.save(nodes_key, index)
+
+        return index
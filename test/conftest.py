@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules are imported flat, as in test/testing.py
+for directory in ("src", "bench"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
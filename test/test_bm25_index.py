@@ -0,0 +1,34 @@
+from bm25_index import Bm25Index, tokenize
+
+NODES = [
+    "*Course Information*\nThe course director is Jane Doe.",
+    {"node_number": 1, "text": "*Readings*\nThe readings for each week are on eClass.", "type": "NarrativeText",
+     "metadata": {}},
+    "*Office Hours*\nOffice hours are on Tuesdays, 4:30 PM.",
+    "*Essay*\nThe essay is due on Nov 21. Late essays lose 2% per day. The essay counts for 30% of the grade.",
+    "*Grading*\nThe grade of the essay and the readings quiz.",
+]
+
+
+def test_tokenize_folds_plurals_and_drops_stop_words_and_urls():
+    assert tokenize("What are the readings at [eClass] (https://eclass.yorku.ca/x)?") == ["reading", "eclass"]
+    assert tokenize("Office hours: 4:30") == ["office", "hour", "4", "30"]
+
+
+def test_search_ranks_the_node_with_the_most_query_terms_first():
+    index = Bm25Index(NODES)
+
+    results = index.search("When is the essay due?", 3)
+    assert [node for node, _ in results] == [3, 4]
+    assert results[0][1] > results[1][1]
+
+    assert index.search("readings", 1)[0][0] == 1
+    assert index.search("zoom link") == []
+
+
+def test_shortlist_fills_k_with_the_other_nodes_in_order():
+    index = Bm25Index(NODES)
+
+    assert index.shortlist("When is the essay due?", 4) == [3, 4, 0, 1]
+    assert index.shortlist("zoom link", 2) == [0, 1]
+    assert len(index.shortlist("essay", 10)) == len(NODES)
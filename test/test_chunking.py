@@ -0,0 +1,43 @@
+import re
+
+from al_types import AlTextTable
+from conversions import chunk_node, make_node
+from table_templates import DEFAULT_TEMPLATES, ROW_SEPARATOR
+
+TUTORIALS = AlTextTable(
+    "Tutorials",
+    ("Tutorial", "TA", "Time", "Room", "Zoom"),
+    tuple((str(number), f"TA {number}", "Thursday, 6:30 PM", f"VH {1000 + number}", "TBD") for number in range(1, 13)),
+)
+
+
+def test_a_long_table_is_split_between_its_rows():
+    chunks = chunk_node(make_node(0, DEFAULT_TEMPLATES.render(TUTORIALS)), 0, 120)
+    assert len(chunks) > 2
+
+    for chunk in chunks:
+        text = chunk["text"]
+        assert text.startswith("*Tutorials*\n") and not text[len("*Tutorials*\n")].isspace()
+        assert ROW_SEPARATOR not in text
+
+        # The four lines of a row are in the same chunk
+        for number in set(re.findall(r"If you are in Tutorial (\d+),", text)):
+            assert text.count(f"If you are in Tutorial {number},") == 4
+
+
+def test_a_row_over_the_budget_is_split_on_its_lines():
+    chunks = chunk_node(make_node(0, DEFAULT_TEMPLATES.render(TUTORIALS._replace(rows=TUTORIALS.rows[:1]))), 0, 60)
+
+    assert len(chunks) > 1
+    assert [chunk["metadata"]["chunk"] for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk["text"].startswith("*Tutorials*\n") for chunk in chunks)
+    assert sum(chunk["text"].count("If you are in Tutorial 1,") for chunk in chunks) == 4
+
+
+def test_a_node_within_the_budget_is_kept_whole():
+    text = DEFAULT_TEMPLATES.render(TUTORIALS._replace(rows=TUTORIALS.rows[:1]))
+    node = chunk_node(make_node(3, text), 5)[0]
+
+    assert node["node_number"] == 5
+    assert node["text"] == text.replace(ROW_SEPARATOR, "")
+    assert "chunk" not in node["metadata"]
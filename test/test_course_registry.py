@@ -0,0 +1,34 @@
+from course_registry import load_course
+from node_cache import NodeCache
+from synthetic_syllabus import make_syllabus
+
+
+class CountingCache(NodeCache):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.calls = []
+
+    def get(self, key):
+        value = super().get(key)
+        self.calls.append(("get", value is not None))
+        return value
+
+    def put(self, key, nodes):
+        self.calls.append(("put", True))
+        super().put(key, nodes)
+
+
+def test_a_cached_document_is_loaded_with_its_heading_in_one_get(tmp_path):
+    path = tmp_path / "Syllabus.docx"
+    path.write_bytes(make_syllabus(headings=2).getvalue())
+    cache = CountingCache(str(tmp_path / "cache"))
+
+    converted = load_course("HUMA1000", [str(path)], cache=cache)
+    assert cache.calls == [("get", False), ("put", True)]
+
+    cache.calls.clear()
+    loaded = load_course("HUMA1000", [str(path)], cache=cache)
+    assert cache.calls == [("get", True)]
+
+    assert (loaded.course_number, loaded.course_title) == ("HUMA 1000", "Synthetic Course")
+    assert list(loaded.nodes) == list(converted.nodes)
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from evaluation import read_checkpoint, run_evaluation
+from query_pipeline import ProviderClients, QueryPipeline
+from stub_providers import StubProviderServer
+
+NODES = ["*Essay*\nThe essay is due on Nov 21.", "*Office Hours*\nOffice hours are on Tuesdays."]
+
+
+def evaluate(server, questions, output_path):
+    async def main():
+        async with ProviderClients("stub", "stub", azure_endpoint=server.url, cohere_base_url=server.url) as clients:
+            pipeline = QueryPipeline(NODES, clients, str.strip, lambda query, context: "Question: " + query)
+            return await run_evaluation(pipeline, questions, output_path)
+
+    return asyncio.run(main())
+
+
+def test_a_resumed_run_only_asks_the_missing_and_changed_questions(tmp_path):
+    output_path = str(tmp_path / "results.jsonl")
+    questions = ["When is the essay due?", "When are the office hours?", "Where is the class?"]
+
+    with StubProviderServer() as server:
+        evaluate(server, questions[:2], output_path)
+        assert server.counts["requests"] == 4  # a rerank and a completion per question
+
+        # A crash cut the last record short, and the first question was edited since
+        with open(output_path, "a", encoding="utf-8") as output:
+            output.write('{"position": 2, "question": "Where is')
+        questions[0] = "When is the first essay due?"
+
+        records = evaluate(server, questions, output_path)
+        assert server.counts["requests"] == 8
+
+    assert [record["position"] for record in records] == [0, 1, 2]
+    assert [record["answer"] for record in records] == ["Stub answer to: " + question for question in questions]
+    assert sorted(read_checkpoint(output_path, questions)) == [0, 1, 2]
+
+
+def test_read_checkpoint_leaves_out_failed_and_moved_questions(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    lines = [
+        {"position": 0, "question": "When is the essay due?", "answer": "Nov 21", "error": None},
+        {"position": 1, "question": "When are the office hours?", "answer": None, "error": "retrieval: timeout"},
+        {"position": 2, "question": "Where is the class?", "answer": "Vari Hall", "error": None},
+    ]
+    output_path.write_text("".join(json.dumps(line) + "\n" for line in lines), encoding="utf-8")
+
+    assert sorted(read_checkpoint(str(output_path))) == [0, 2]
+    assert sorted(read_checkpoint(str(output_path), ["When is the essay due?", "Where is the class?"])) == [0]
+    assert read_checkpoint(str(tmp_path / "missing.jsonl")) == {}
@@ -0,0 +1,66 @@
+import io
+from typing import List, Tuple
+
+from docx import Document
+
+from incremental import reconvert_file
+
+
+def make_document(sections: List[Tuple[str, str]]) -> io.BytesIO:
+    docx_file = Document()
+    docx_file.add_paragraph("HUMA 1000", style="Title")
+    docx_file.add_paragraph("Synthetic Course", style="Subtitle")
+
+    for title, text in sections:
+        docx_file.add_heading(title, 1)
+        docx_file.add_paragraph(text)
+
+    file_bytes = io.BytesIO()
+    docx_file.save(file_bytes)
+    file_bytes.seek(0)
+
+    return file_bytes
+
+
+SECTIONS = [
+    ("Course Information", "Course Director:\tJane Doe"),
+    ("Course Description", "The course reads the history of Canada."),
+    ("Readings", "The readings are on the course website."),
+    ("Academic Integrity", "Students follow the academic integrity policy."),
+]
+
+
+def test_inserting_a_section_only_reports_the_new_node():
+    previous = reconvert_file(make_document(SECTIONS))
+    assert previous["changed"] == [node["node_number"] for node in previous["nodes"]]
+
+    sections = SECTIONS[:2] + [("Office Hours", "Office hours are on Tuesdays.")] + SECTIONS[2:]
+    result = reconvert_file(make_document(sections), previous["state"])
+
+    new_node = next(node for node in result["nodes"] if node["text"].startswith("*Office Hours*"))
+    assert result["changed"] == [new_node["node_number"]]
+    assert result["removed"] == []
+    assert result["renumbered"] == {
+        node["node_number"]: node["node_number"] + 1
+        for node in previous["nodes"] if node["node_number"] >= new_node["node_number"]
+    }
+
+
+def test_removing_a_section_reports_its_previous_node():
+    previous = reconvert_file(make_document(SECTIONS))
+    result = reconvert_file(make_document(SECTIONS[:2] + SECTIONS[3:]), previous["state"])
+
+    readings = next(node for node in previous["nodes"] if node["text"].startswith("*Readings*"))
+    assert result["changed"] == []
+    assert result["removed"] == [readings["node_number"]]
+
+
+def test_editing_a_section_reports_only_that_node():
+    previous = reconvert_file(make_document(SECTIONS))
+    sections = SECTIONS[:2] + [("Readings", "The readings are in the library.")] + SECTIONS[3:]
+    result = reconvert_file(make_document(sections), previous["state"])
+
+    readings = next(node for node in result["nodes"] if node["text"].startswith("*Readings*"))
+    assert result["changed"] == [readings["node_number"]]
+    assert result["renumbered"] == {}
+    assert result["removed"] == []
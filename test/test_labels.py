@@ -0,0 +1,29 @@
+from conversions import COURSE_INFORMATION_LABELS, LabelRewriter, convert_file, converter_version, iter_convert_file
+from incremental import reconvert_file
+from node_cache import NodeCache
+from synthetic_syllabus import make_syllabus
+
+LABELS = LabelRewriter({**COURSE_INFORMATION_LABELS, "Course Director:": "The instructor is "})
+
+
+def course_information(nodes):
+    return next(node["text"] for node in nodes if node["text"].startswith("*Course Information*"))
+
+
+def test_labels_are_used_by_every_entry_point():
+    for nodes in (
+        convert_file(make_syllabus(headings=2), labels=LABELS),
+        list(iter_convert_file(make_syllabus(headings=2), labels=LABELS)),
+        reconvert_file(make_syllabus(headings=2), labels=LABELS)["nodes"],
+    ):
+        assert "The instructor is " in course_information(nodes)
+
+
+def test_labels_are_part_of_the_converter_version(tmp_path):
+    assert converter_version(labels=LABELS) != converter_version()
+
+    cache = NodeCache(str(tmp_path))
+    convert_file(make_syllabus(headings=2), cache)
+    nodes = convert_file(make_syllabus(headings=2), cache, labels=LABELS)
+
+    assert "The instructor is " in course_information(nodes)
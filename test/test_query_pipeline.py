@@ -0,0 +1,118 @@
+import asyncio
+
+from conversions import make_node
+from course_registry import merge_documents
+from node_store import NodeStore
+from query_pipeline import ProviderClients, QueryPipeline, retry_delay
+from stub_providers import StubProviderServer
+
+NODES = [
+    "*Essay*\nThe essay is due on Nov 21.",
+    "*Readings*\nThe readings are on the course website.",
+    "*Office Hours*\nOffice hours are on Tuesdays.",
+]
+
+
+def construct_prompt(query, prompt_context):
+    return "Context:\n" + prompt_context + "\n\n=====\n\nQuestion: " + query + " \n\nAnswer:"
+
+
+def run(server, test, nodes=NODES, **options):
+    async def main():
+        async with ProviderClients("stub", "stub", azure_endpoint=server.url, cohere_base_url=server.url) as clients:
+            return await test(QueryPipeline(nodes, clients, str.strip, construct_prompt, **options))
+
+    return asyncio.run(main())
+
+
+async def read_stream(pipeline, query):
+    return "".join([token async for token in pipeline.answer_stream(query)])
+
+
+def test_opening_a_stream_is_retried_after_a_rate_limit():
+    async def test(pipeline):
+        return await read_stream(pipeline, "When is the essay due?"), pipeline.retries
+
+    # The rerank is the first request, opening the stream the second one
+    with StubProviderServer(rate_limit_every=2) as server:
+        answer, retries = run(server, test, max_retries=1, retry_backoff=0.0)
+
+    assert answer.strip() == "Stub answer to: When is the essay due?"
+    assert retries == 1
+    assert server.counts["requests"] == 3
+
+
+def test_a_stream_releases_its_slot_at_the_first_piece():
+    async def test(pipeline):
+        first = pipeline.answer_stream("When is the essay due?")
+        await first.__anext__()
+
+        # With one slot, the second query only starts if the first one, still being read, released it
+        second = await asyncio.wait_for(read_stream(pipeline, "When are the office hours?"), 5)
+        rest = "".join([token async for token in first])
+
+        return second, rest
+
+    with StubProviderServer(token_latency=0.01) as server:
+        second, rest = run(server, test, concurrency=1)
+
+    assert second.strip() == "Stub answer to: When are the office hours?"
+    assert rest.strip().endswith("essay due?")
+
+
+
+class RateLimited(Exception):
+    def __init__(self, status_code, headers):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers
+
+
+def test_retry_delay_honours_retry_after():
+    assert retry_delay(RateLimited(429, {"retry-after": "2"}), 0, 1.0) == 2.0
+    assert 0.5 <= retry_delay(RateLimited(503, {}), 1, 0.25) <= 1.0
+    assert 1.0 <= retry_delay(asyncio.TimeoutError(), 0, 1.0) <= 2.0
+    assert retry_delay(RateLimited(400, {"retry-after": "2"}), 0, 1.0) is None
+
+
+def test_rate_limited_queries_are_retried():
+    queries = ["When is the essay due?", "Where are the readings?", "When are the office hours?"] * 4
+
+    async def test(pipeline):
+        return await pipeline.answer_many(queries), pipeline.retries
+
+    # Every third request is refused with a 429 and "Retry-After: 0", which the retries wait instead of the backoff.
+    # One query at a time, so that the retry of a refused request is never the next refused one
+    with StubProviderServer(rate_limit_every=3) as server:
+        answers, retries = run(server, test, concurrency=1, max_retries=1, retry_backoff=60.0)
+
+    assert [answer["error"] for answer in answers] == [None] * len(queries)
+    assert [answer["answer"] for answer in answers] == ["Stub answer to: " + query for query in queries]
+    assert retries == server.counts["requests"] // 3
+
+
+def test_a_stage_still_failing_after_its_retries_is_reported():
+    with StubProviderServer(rate_limit_every=1) as server:
+        answer = run(server, lambda pipeline: pipeline.answer("When is the essay due?"), max_retries=2)
+
+    assert answer["answer"] is None
+    assert answer["error"].startswith("retrieval: ")
+    assert server.counts["requests"] == 3
+
+
+def test_rerank_gets_the_node_texts_and_the_prompt_their_context():
+    documents = []
+
+    class RecordingServer(StubProviderServer):
+        def rerank(self, request):
+            documents.extend(request["documents"])
+            return super().rerank(request)
+
+    nodes = NodeStore.from_nodes(merge_documents({"Syllabus.docx": [make_node(0, text) for text in NODES]}))
+
+    with RecordingServer() as server:
+        answer = run(server, lambda pipeline: pipeline.answer("When is the essay due?"), nodes=nodes)
+
+    assert documents == NODES
+    assert answer["index"] == 0
+    assert answer["prompt_context"] == "From Syllabus.docx:\n" + NODES[0]
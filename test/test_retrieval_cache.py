@@ -0,0 +1,44 @@
+import asyncio
+
+from bm25_index import Bm25Index
+from query_pipeline import ProviderClients, QueryPipeline
+from retrieval_cache import RetrievalCache, candidate_set_key, node_set_key
+from stub_providers import StubProviderServer
+
+NODES = [
+    "*Essay*\nThe essay is due on Nov 21.",
+    "*Readings*\nThe readings are on the course website.",
+    "*Office Hours*\nOffice hours are on Tuesdays.",
+]
+
+
+def test_key_changes_with_the_nodes_and_the_candidates():
+    cache = RetrievalCache()
+    nodes_key = node_set_key(NODES)
+    cache.put("When is the essay due?", nodes_key, (0.9, NODES[0], 0), candidate_set_key(None, 10))
+
+    assert cache.get("  when is the ESSAY due? ", nodes_key, candidate_set_key(None, 10)) == (0.9, NODES[0], 0)
+    assert cache.get("When is the essay due?", node_set_key(NODES[:2]), candidate_set_key(None, 10)) is None
+    assert cache.get("When is the essay due?", nodes_key, candidate_set_key([0, 1])) is None
+    assert cache.get("When is the essay due?", nodes_key) is None
+
+
+def test_pipeline_reranks_again_only_when_the_key_changes():
+    async def retrieve(server, nodes, queries):
+        async with ProviderClients("stub", "stub", azure_endpoint=server.url, cohere_base_url=server.url) as clients:
+            pipeline = QueryPipeline(nodes, clients, str.strip, lambda query, context: context, Bm25Index(nodes), cache)
+            return [await pipeline.retrieve(query, candidates) for query, candidates in queries]
+
+    cache = RetrievalCache()
+
+    with StubProviderServer() as server:
+        results = asyncio.run(retrieve(server, NODES, [("When is the essay due?", None)] * 2))
+        assert results[0] == results[1]
+        assert results[0][1:] == (NODES[0], 0)
+        assert server.counts["requests"] == 1
+
+        # Given candidates and re-converted nodes are not answered from the entry of the BM25 shortlist
+        asyncio.run(retrieve(server, NODES, [("When is the essay due?", [1, 2])]))
+        reconverted = NODES[:1] + ["*Essay*\nThe essay is due on Nov 28."]
+        asyncio.run(retrieve(server, reconverted, [("When is the essay due?", None)]))
+        assert server.counts["requests"] == 3
@@ -0,0 +1,40 @@
+import numpy as np
+
+from vector_index import EmbeddingStore, HashingEmbedder, VectorIndex
+
+NODES = [
+    "*Course Information*\nThe course director is Jane Doe.",
+    "*Readings*\nThe readings for each week are on eClass.",
+    "*Office Hours*\nOffice hours are on Tuesdays in Vari Hall.",
+    "*Essay*\nThe essay is due on Nov 21 and counts for 30% of the grade.",
+]
+
+
+def test_search_returns_the_top_k_of_each_query_best_first():
+    index = VectorIndex.build(NODES, HashingEmbedder())
+
+    essay, office_hours = index.search(["When is the essay due?", "Where are the office hours?"], 2)
+
+    assert [node for node, _ in essay][0] == 3
+    assert [node for node, _ in office_hours][0] == 2
+    assert len(essay) == 2 and essay[0][1] >= essay[1][1]
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+
+    assert len(index.search(["essay"], 10)[0]) == len(NODES)
+    assert index.search([], 2) == []
+
+
+def test_embedding_store_round_trip(tmp_path):
+    embedder = HashingEmbedder()
+    store = EmbeddingStore(str(tmp_path))
+
+    built = store.get_or_build("nodes-key", NODES, embedder)
+    loaded = store.load("nodes-key", embedder)
+
+    assert isinstance(loaded.matrix, np.memmap)
+    assert np.array_equal(loaded.matrix, built.matrix)
+    assert loaded.search(["essay due"], 2) == built.search(["essay due"], 2)
+
+    # Another node set or embedder is not answered from the stored file
+    assert store.load("other-key", embedder) is None
+    assert store.load("nodes-key", HashingEmbedder(64)) is None
@@ -1,21 +1,23 @@
 # ---------------------------------------------------------------------------------------------------------- #
 # Pre-processes a syllabus for Al the bot
 # ---------------------------------------------------------------------------------------------------------- #
-import io
+import asyncio
+import functools
 import os
-import re  # regular expression
-from datetime import datetime  # to find the string dates in the nodes and convert them to date objects
+from datetime import datetime  # today's date, for the temporal relations
 
-import cohere  # to use Cohere, which chooses the best node (from the sorted_nodes_text) for the prompt context
-import mammoth  # to convert docx to html
-import pandas as pd
 # Import packages ------------------------------------------------------------------------------------------ #
-from docx import Document  # to import the syllabus (ocx file)
 from dotenv import load_dotenv  # install python-dotenv. This is to read .env file containing api keys. Must load python-dotenv
 from openai import AzureOpenAI  # to use Azure OpenAI
 from openai.types.chat import ChatCompletionUserMessageParam  # to do the chat completions
 
-from conversions import convert_file, find_h_level, find_sections_paragraphs, convert_doc_to_nodes, read_tables, render_tables_add_to_nodes_text, clean_up, convert_to_dict
+from evaluation import export_results, read_question_bank, run_evaluation
+from metrics import CompletionTimer
+from course_registry import CourseRegistry, load_course
+from node_cache import NodeCache
+from query_pipeline import ProviderClients, QueryPipeline
+from retrieval_cache import RetrievalCache
+from vector_index import EmbeddingStore, OpenAIEmbedder
 
 load_dotenv()  # load .env file
 
@@ -23,20 +25,41 @@ load_dotenv()  # load .env file
 # json_file_source = "C:/Users/donal/OneDrive - York University/New/Al/Al-E/syllabus.json"
 # file_source = "C:/Users/donal/OneDrive - York University/New/Al/Al-E/Syllabus6.docx"
 file_source = "C:/Users/donal/OneDrive - York University/New/Roots of Modern Canada/0. General/_FW 2024-2025/Syllabus HUMA 1740 FW (2024-2025).docx"
-doc = Document(file_source)
+questions_source = "C:/Users/donal/OneDrive - York University/New/Al/Al-E/Questions.docx"  # answers to common questions, searched with the syllabus
+course_id = "HUMA1740"  # the course answered by this run, one of the courses registered below
 test_queries = "C:/Users/donal/OneDrive - York University/New/Al/Al-E/Queries_Temporal.xlsx"  # contains the test queries, either Queries_Questions.xlsx or Test_Questions.xlsx or Queries_Syllabus.xlsx
 testing_results = "C:/Users/donal/OneDrive - York University/New/Al/Al-E/Testing_Results.xlsx"  # output file containing the testing results
+testing_checkpoint = os.path.splitext(testing_results)[0] + ".jsonl"  # results streamed as they arrive, a crashed run resumes from it
+evaluation_concurrency = 8  # number of test questions answered at once
 
-# Initial set-up
-question_bank = data = pd.read_excel(test_queries, sheet_name='Sheet1')  # grab Excel sheet with questions and create data frame
+rerank_shortlist_size = 10  # number of nodes, shortlisted locally with BM25, that are sent to Cohere
+
+# "bm25" shortlists each query with the BM25 index, "embeddings" shortlists all the queries at once with node embeddings
+retrieval_mode = "bm25"
+embedding_deployment = "cria-dev-text-embedding-3-large"  # Azure OpenAI deployment that embeds the nodes and the queries
+
+# Rerank results of repeated queries, persisted when AL_RETRIEVAL_CACHE is the path of a JSON file
+retrieval_cache = RetrievalCache(path=os.getenv('AL_RETRIEVAL_CACHE'))
 
-with open(file_source, "rb") as docx_file:
-    result = mammoth.convert_to_html(docx_file)  # this converts my doc to html
-    html_text = result.value
+# Provider clients are created once and reused by every query, so their connections stay open between calls
+openai_client = AzureOpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    api_version="2024-10-21",  # the first GA version that sends the token usage of streamed completions
+    azure_endpoint="https://cria-dev-useast.openai.azure.com"
+)
 
-# Put the course title and rubric/number in variables for further use
-course_number = doc.paragraphs[0].text.strip()
-course_title = doc.paragraphs[1].text.strip()
+# Initial set-up
+# Converted nodes are reused across runs as long as the documents and the converter do not change
+course_loader = functools.partial(load_course, cache=NodeCache(os.getenv('AL_CACHE_DIR', '.al_cache')))
+if retrieval_mode == "embeddings":
+    # The node embeddings are computed when the course is loaded, once per conversion, and memory-mapped afterwards
+    course_loader = functools.partial(course_loader, embedder=OpenAIEmbedder(openai_client, embedding_deployment),
+                                      embedding_store=EmbeddingStore(os.getenv('AL_EMBEDDINGS_DIR', '.al_embeddings')))
+
+# Courses are converted on their first query, evicted when the loaded courses use more than max_bytes and reloaded
+# when their documents change. Register every course of the faculty to serve them from one process
+course_registry = CourseRegistry(max_bytes=int(os.getenv('AL_REGISTRY_MAX_BYTES', 512 * 1024 * 1024)), loader=course_loader)
+course_registry.register(course_id, file_source, questions_source)  # one candidate pool for both documents
 
 
 # Functions -------------------------------------------------------------------------------------------------- #
@@ -46,191 +69,109 @@ course_title = doc.paragraphs[1].text.strip()
 # Main program ----------------------------------------------------------------------------------------------- #
 # -------------------------------------------------------------------------------------------------------------#
 
-def get_test_questions(test_queries):
-    question_bank = pd.read_excel(test_queries,
-                                  sheet_name='Sheet1')  # grab Excel sheet with questions and create data frame
-    test_queries = question_bank['Queries'].tolist()
+def get_test_questions(question_bank):
+    test_queries = question_bank['Queries'].tolist()  # the question bank is read once per run
     return test_queries
 
 
-def pre_process_query(query, html_text):
-    # If the query includes the course number or title, it always selects the Course Information, which is not helpful.
-    query = query.replace(course_number, "this course")
-    query = query.replace(course_title, "this course")
-
-    # LLM has difficulty ansering questions that start with "I don't know", so it needs to be modified.
-    if query.startswith(("I don't know", "I dont know")):
-        query = query.replace("I don't know", "I would like to know")
-        query = query.replace("I dont know", "I would like to know")
-
-    # add a question mark if the query doesn't end in a question mark and starts with a question word
-    question_start = ["what", "how", "why", "when", "who", "whom", "whose", "which", "where", "does", "is", "are",
-                      "can", "could", "will", "would", "should", "may", "might", "have", "must"]
-    if query[len(query) - 1] != "?":
-        if query.split()[0].lower() in question_start:
-            query = query.rstrip() + "?"
-
-    # this part is about handling temporal relations with previous, next, first and last
-    # assignment_dates = ["October 19, 2023", "November 30, 2023", "February 29, 2024", "April 4, 2024"]
-    # html_buffer = StringIO(html_text)  # Have to wrap the HTML string in a StringIO object
-    # doc_tables_df = pd.read_html(html_buffer)  # This grabs all the tables in the syllabus and stores them in a dataframe
-    # print("doc_tables_df: ", doc_tables_df[evaluation_table_index])
+def pre_process_query(query):
+    # The course number and title become "this course", "I don't know" is rephrased and questions get their question mark
+    query = query_router.normalize(query)
     return query
 
 
-def launch_cohere(sorted_nodes_text, query):
-    co = cohere.Client(os.getenv('COHERE_DEV'))  # prod key in env.env
+def make_pipeline(clients, concurrency=1):  # the retrieval (cache, BM25 shortlist, Cohere rerank) is the pipeline's
+    # The retrieval cache key includes Course.nodes_key, so a re-conversion of the course invalidates the cached results
+    return QueryPipeline(sorted_nodes_text, clients, pre_process_query, construct_prompt, bm25_index, retrieval_cache,
+                         concurrency=concurrency, shortlist_size=rerank_shortlist_size, max_retries=5, nodes_key=nodes_key)
 
-    # initial value
-    docs = sorted_nodes_text
 
-    response = co.rerank(
-        model="rerank-english-v3.0",
-        query=query,
-        documents=docs,
-        top_n=3,
-    )
+def launch_cohere(query, candidates=None):  # returns the relevance score, the prompt context and the index of the best node
+    async def retrieve():
+        async with ProviderClients() as clients:
+            return await make_pipeline(clients).retrieve(query, candidates)
+    return asyncio.run(retrieve())
 
-    results = str(response)
-    pos_index1 = results.find("index=")
-    pos_index2 = results.find(",", pos_index1)
-    index = int(results[pos_index1 + 6:pos_index2:])
-    pos_index1 = results.find("relevance_score=")
-    pos_index2 = results.find(")", pos_index1)
-    relevance_score = float(results[pos_index1 + 16:pos_index2:])
-    prompt_context = sorted_nodes_text[int(index)]
-
-    return relevance_score, prompt_context, index
-
-
-def find_dates_in_nodes(lines, date_today):  # get the node with the dates and identify the line before today and the line after today's date
-    i = 0
-    date_dic = {}
-    # create a dictionary with the line index and the date (which converted into a date object for calculations)
-    for line in lines:
-        match = re.search(r"[A-S][a-v]{2} \d{1,2}, 20\d{2}", line)  # matches dates that look like "Nov 4, 2023"
-        if match:
-            line_idx = i
-            date_obj = datetime.strptime(match.group(), '%b %d, %Y')  # convert the date string to a datetime object
-            date_dic[line_idx] = date_obj  # add the date to the dictionary
-        i = i + 1
-
-    # finds the dictionary key where the date is before today's date
-    for key, value in date_dic.items():
-        if value <= date_today:
-            date_before = key
-
-    # finds the dictionary key where the date is after today's date
-    iterator = iter(date_dic)
-    for key in iterator:
-        if key == date_before:
-            break
-    date_after = next(iterator, None)
-    return date_after, date_before
-
-
-def add_temporal_relation(query, sorted_nodes_text):  # this function adds temporal relations to the prompt in construct_prompt
-    # date_today = datetime.today().strftime('%b %d, %Y')
+
+def describe_lecture(event):  # the topic of a lecture and its readings, as a sentence for the prompt
+    return f"is '{event['title']}', on {event['date_text']}.\nThe reading(s) for this topic: {event['detail']}"
+
+
+def add_temporal_relation(query, timeline):  # this function adds temporal relations to the prompt in construct_prompt
+    # date_today = datetime.today()
     date_today = datetime.strptime("Nov 21, 2023", "%b %d, %Y")  # for testing purposes
+    today = date_today.date()
+    today_text = date_today.strftime("%b %d, %Y")
     temporal_relation = ""
-    # find the node for the Summary of Evaluation table and the node for the Schedule and Readings table
-    i = 0
-
-    assignment_idx: int = -1
-    lecture_idx: int = -1
-
-    for sorted_node in sorted_nodes_text:
-        if "*Schedule and Readings*" in sorted_node:
-            lecture_idx = i
-        elif "*Summary of Evaluation*" in sorted_node:
-            assignment_idx = i
-        i = i + 1
-
-    # If the query contains the word "assignment", including misspelling (assi\w{1,3}ent)
-    if re.search(r"assi\w{1,3}ent", query.lower()) and ("next" in query.lower() or "upcoming" in query.lower()):
-        temporal_node = sorted_nodes_text[assignment_idx]  # Uses the node for the Summary of Evaluation table
-        lines = temporal_node.splitlines()  # split the node into lines
-        date_after, date_before = find_dates_in_nodes(lines, date_today)
-        temp_index = lines[int(date_after)].find("is due on")
-        temporal_relation = (
-                f"Today is {date_today.strftime("%b %d, %Y")} and the next assignment is the" + lines[int(date_after)][4:temp_index] + "and it is due on " + lines[int(date_after)][-13:]
-        )
-
-    elif re.search(r"assi\w{1,3}ent", query.lower()) and re.search(r"previo\w*", query.lower()):
-        temporal_node = sorted_nodes_text[assignment_idx]  # Uses the node for the Summary of Evaluation table
-        lines = temporal_node.splitlines()  # split the node into lines
-        date_after, date_before = find_dates_in_nodes(lines, date_today)
-        temp_index = lines[int(date_before)].find("is due on")
-        temporal_relation = "Today is " + date_today.strftime("%b %d, %Y") + " and the previous assignment was the" + \
-                            lines[int(date_before)][4:temp_index] + "and it was due on " + lines[int(date_before)][-13:]
-
-    elif re.search(r"assi\w{1,3}ent", query.lower()) and ("first" in query.lower() or "fisrt" in query.lower()):
-        temporal_node = sorted_nodes_text[assignment_idx]  # Uses the node for the Summary of Evaluation table
-        lines = temporal_node.splitlines()  # split the node into lines
-        temp_index = lines[5].find("is due on")
-        temporal_relation = "The first assignment is the" + lines[5][4:temp_index] + "and is due on " + lines[5][
-                                                                                                        -13:] + "\n"
-
-    elif re.search(r"assi\w{1,3}ent", query.lower()) and ("last" in query.lower() or "lasst" in query.lower()):
-        temporal_node = sorted_nodes_text[assignment_idx]  # Uses the node for the Summary of Evaluation table
-        lines = temporal_node.splitlines()  # split the node into lines
-        temp_index = lines[-2].find("is due on")
-        temporal_relation = "The last assignment is the" + lines[-2][4:temp_index] + "and is due on" + lines[-2][
-                                                                                                       -13:] + "\n"
-
-    elif re.search(r"assi\w{1,3}ent", query.lower()) and ("today" in query.lower() or "tody" in query.lower()):
-        temporal_node = sorted_nodes_text[assignment_idx]  # Uses the node for the Summary of Evaluation table
-        lines = temporal_node.splitlines()  # split the node into lines
-        date_after, date_before = find_dates_in_nodes(lines, date_today)
-        date_in_line = lines[int(date_before)][-13:-1].strip()
-        if datetime.strptime(date_in_line, "%b %d, %Y") == date_today:
-            temp_index = lines[int(date_before)].find("is due on")
-            temporal_relation = "Today is " + date_today.strftime("%b %d, %Y") + " and today's assignment is the" + \
-                                lines[int(date_before)][4:temp_index]
+
+    # The assignments and lectures were read from the Summary of Evaluation and Schedule and Readings tables at conversion
+    # time (see timeline.py), each lookup below is a binary search in the sorted dates
+    # The query is about an assignment if it contains the word "assignment", including misspellings, otherwise about class content
+    intent = query_router.classify(query)
+
+    if intent == ("assignment", "next"):
+        assignment = timeline.next("assignment", today)
+        if assignment is not None:
+            temporal_relation = f"Today is {today_text} and the next assignment is the {assignment['title']} and it is due on {assignment['date_text']}"
         else:
-            temporal_relation = "Today is " + date_today.strftime(
-                "%b %d, %Y") + " and there are no assignments due today"
+            temporal_relation = f"Today is {today_text} and there are no more assignments"
+
+    elif intent == ("assignment", "previous"):
+        assignment = timeline.previous("assignment", today)
+        if assignment is not None:
+            temporal_relation = f"Today is {today_text} and the previous assignment was the {assignment['title']} and it was due on {assignment['date_text']}"
+        else:
+            temporal_relation = f"Today is {today_text} and no assignment was due yet"
+
+    elif intent == ("assignment", "first"):
+        assignment = timeline.first("assignment")
+        if assignment is not None:
+            temporal_relation = f"The first assignment is the {assignment['title']} and is due on {assignment['date_text']}\n"
+
+    elif intent == ("assignment", "last"):
+        assignment = timeline.last("assignment")
+        if assignment is not None:
+            temporal_relation = f"The last assignment is the {assignment['title']} and is due on {assignment['date_text']}\n"
+
+    elif intent == ("assignment", "today"):
+        assignments = timeline.on("assignment", today)
+        if assignments:
+            temporal_relation = f"Today is {today_text} and today's assignment is the " + " and the ".join(assignment['title'] for assignment in assignments)
+        else:
+            temporal_relation = f"Today is {today_text} and there are no assignments due today"
 
     # If the query is about class content (i.e. the word "assignment" is not in Query)------- #
 
-    else:
-        if "next" in query.lower() or "upcoming" in query.lower():
-            temporal_node = sorted_nodes_text[lecture_idx]  # Uses the node for the Schedule and Readings table
-            lines = temporal_node.splitlines()  # split the node into lines
-            date_after, date_before = find_dates_in_nodes(lines, date_today)
-            temporal_relation = "Today is " + date_today.strftime("%b %d, %Y") + " and the next topic in class" + lines[
-                                                                                                                      int(date_after)][
-                                                                                                                  10:] + "\n" + \
-                                lines[int(date_after + 1)]
-
-        elif re.search(r"previo\w*", query.lower()):
-            temporal_node = sorted_nodes_text[lecture_idx]  # Uses the node for the Schedule and Readings table
-            lines = temporal_node.splitlines()  # split the node into lines
-            date_after, date_before = find_dates_in_nodes(lines, date_today)
-            temporal_relation = "Today is " + date_today.strftime("%b %d, %Y") + " and the previous topic in class" + \
-                                lines[int(date_before - 1)][10:] + "\n" + lines[int(date_before)]
-
-        elif "first" in query.lower():
-            temporal_node = sorted_nodes_text[lecture_idx]  # Uses the node for the Schedule and Readings table
-            lines = temporal_node.splitlines()  # split the node into lines
-            temporal_relation = "The first topic presented in class" + lines[1][10:] + "\n" + lines[2]
-
-        elif "last" in query.lower():
-            temporal_node = sorted_nodes_text[lecture_idx]  # Uses the node for the Schedule and Readings table
-            lines = temporal_node.splitlines()  # split the node into lines
-            temporal_relation = "The last topic presented in class" + lines[-2][10:] + "\n" + lines[-3]
-
-        elif "today" in query.lower():
-            temporal_node = sorted_nodes_text[lecture_idx]  # Uses the node for the Schedule and Readings table
-            lines = temporal_node.splitlines()  # split the node into lines
-            date_after, date_before = find_dates_in_nodes(lines, date_today)
-            date_in_line = lines[int(date_before - 1)][-13:-1].strip()
-            if datetime.strptime(date_in_line, "%b %d, %Y") == date_today:
-                temporal_relation = "Today is " + date_today.strftime(
-                    "%b %d, %Y") + " and today's topic presented in class" + lines[int(date_before - 1)][10:] + "\n" + \
-                                    lines[int(date_before)]
-            else:
-                temporal_relation = "Today is " + date_today.strftime("%b %d, %Y") + " and there is no class today"
+    elif intent == ("lecture", "next"):
+        lecture = timeline.next("lecture", today)
+        if lecture is not None:
+            temporal_relation = f"Today is {today_text} and the next topic in class " + describe_lecture(lecture)
+        else:
+            temporal_relation = f"Today is {today_text} and there are no more classes"
+
+    elif intent == ("lecture", "previous"):
+        lecture = timeline.previous("lecture", today)
+        if lecture is not None:
+            temporal_relation = f"Today is {today_text} and the previous topic in class " + describe_lecture(lecture)
+        else:
+            temporal_relation = f"Today is {today_text} and there was no class yet"
+
+    elif intent == ("lecture", "first"):
+        lecture = timeline.first("lecture")
+        if lecture is not None:
+            temporal_relation = "The first topic presented in class " + describe_lecture(lecture)
+
+    elif intent == ("lecture", "last"):
+        lecture = timeline.last("lecture")
+        if lecture is not None:
+            temporal_relation = "The last topic presented in class " + describe_lecture(lecture)
+
+    elif intent == ("lecture", "today"):
+        lectures = timeline.on("lecture", today)
+        if lectures:
+            temporal_relation = f"Today is {today_text} and today's topic presented in class " + describe_lecture(lectures[0])
+        else:
+            temporal_relation = f"Today is {today_text} and there is no class today"
     return temporal_relation
 
 
@@ -238,24 +179,35 @@ def construct_prompt(query, prompt_context):
     system_prompt = "You are a helpful assistant for this course, " + course_number + " ('" + course_title + "'), at York University."
     header = "Answer the question as truthfully as possible using the provided context. If the answer is not contained within the text below, say \"I don't know.\". If a URL link is in the context, always include it in the response."
     separator = "\n\n=====\n\n"
-    # context = prompt_context # actual node provided by Cohere
+    # context = prompt_context # actual node provided by Cohere, after the name of its source document
     if file_source == "C:/Users/donal/OneDrive - York University/New/Al/Al-E/Syllabus3.docx":
-        temporal_relation = add_temporal_relation(query, sorted_nodes_text)
+        temporal_relation = add_temporal_relation(query, timeline)
     else:
         temporal_relation = ""
     prompt = system_prompt + separator + header + separator + "Context:\n" + prompt_context + "\n\n" + temporal_relation + separator + "Question: " + query + " " + "\n\nAnswer:"
     return prompt
 
 
+async def run_test_questions(test_questions, candidate_lists):  # answers the test questions concurrently, with retries
+    async with ProviderClients() as clients:
+        pipeline = make_pipeline(clients, concurrency=evaluation_concurrency)
+        return await run_evaluation(pipeline, test_questions, testing_checkpoint, candidate_lists)
+
+
+def print_completion_metrics(metrics):  # prints the time to first token, total latency and token counts of a chat completion
+    first_token = "no content" if metrics["seconds_to_first_token"] is None else f"first token after {metrics['seconds_to_first_token']:.2f} s"
+    if metrics['completion_tokens'] is not None:
+        tokens = f"{metrics['prompt_tokens']} prompt and {metrics['completion_tokens']} completion tokens"
+    else:
+        tokens = f"{metrics['chunks']} chunks (the provider sent no token usage)"
+    print(f"Completion: {first_token}, {metrics['seconds']:.2f} s in total, {tokens}")
+
+
 def launch_chat_completion(query, prompt_context):
-    client = AzureOpenAI(
-        api_key=os.getenv('OPENAI_API_KEY'),
-        api_version="2024-02-01",
-        azure_endpoint="https://cria-dev-useast.openai.azure.com"
-    )
     deployment_name = 'cria-gpt-4o-mini'
     start_phrase = construct_prompt(query, prompt_context)
-    response = client.chat.completions.create(
+    timer = CompletionTimer(deployment_name, streamed=False)
+    response = openai_client.chat.completions.create(
         model=deployment_name,
         messages=[
             ChatCompletionUserMessageParam(
@@ -266,84 +218,109 @@ def launch_chat_completion(query, prompt_context):
         max_tokens=4000,
         temperature=1.0
     )
-    completion_response = response.dict()["choices"][0]["message"]["content"]
+    completion_response = response.choices[0].message.content
+    timer.token()
+    timer.finish(print_completion_metrics, response.usage)
     return completion_response
 
 
+def launch_chat_completion_stream(query, prompt_context):  # same as launch_chat_completion, but yields the answer as it arrives
+    deployment_name = 'cria-gpt-4o-mini'
+    start_phrase = construct_prompt(query, prompt_context)
+    timer = CompletionTimer(deployment_name, streamed=True)
+    usage = None
+    stream = openai_client.chat.completions.create(
+        model=deployment_name,
+        messages=[
+            ChatCompletionUserMessageParam(
+                content=start_phrase,
+                role='user'
+            )
+        ],
+        max_tokens=4000,
+        temperature=1.0,
+        stream=True,
+        stream_options={"include_usage": True}  # the token counts come in a last chunk, without choices
+    )
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:  # Azure sends its content filter results in chunks without choices
+            timer.token()
+            yield chunk.choices[0].delta.content
+    timer.finish(print_completion_metrics, usage)
+
+
 if __name__ == '__main__':
 
-    file_bytes: bytes = open(file_source, "rb").read()
+    course_registry.watch()  # reloads the course in the background when one of its documents is saved
 
-    sorted_nodes_text = convert_file(io.BytesIO(file_bytes))
+    # The nodes, BM25 index, timeline and query router of the course, built once when it is loaded
+    course = course_registry.get(course_id)
+    sorted_nodes_text = course.nodes
+    nodes_key = course.nodes_key  # hash of the nodes, for the retrieval cache
+    bm25_index = course.bm25_index  # shortlists the nodes of each query
+    timeline = course.timeline  # assignments and lectures by date, for next/previous/today questions
+    query_router = course.router  # normalizes the queries and finds what they ask about
+    course_number = course.course_number
+    course_title = course.course_title
 
     # This part let's you chose whether to run the program in auto or manual mode
     run_mode = "manual"  # "auto" or "manual". Auto is for auto testing all questions and manual is for individual queries
 
+    stream_answers = True  # in manual mode, print the answer as it is generated instead of waiting for all of it
+
     if run_mode == "auto":  # start the automatic testing
-        test_questions = get_test_questions(test_queries)  # get all the test question from the testing file
-        relevance_scores_list = []
-        index_list = []
-        completion_response_list = []
-        for i in range(len(get_test_questions(test_queries))):  # test each question
-            query = test_questions[i]
-            query = pre_process_query(query, html_text)
-            relevance_score, prompt_context, index = launch_cohere(sorted_nodes_text,
-                                                                   query)  # get the prompt context for the chat completion
-            relevance_scores_list.append(relevance_score)
-            index_list.append(index)
-            completion_response = launch_chat_completion(query, prompt_context)  # this is where the chat completion happens
-            completion_response_list.append(completion_response)  # where the completions are stored
+        question_bank = read_question_bank(test_queries)  # grab Excel sheet with questions and create data frame, read once
+        test_questions = get_test_questions(question_bank)  # get all the test question from the testing file
+
+        queries = [routed.query for routed in query_router.route_many(test_questions)]  # normalized in one batch
+        if retrieval_mode == "embeddings":
+            # The node embeddings were computed when the course was loaded
+            hits_lists = course.vector_index.search(queries, rerank_shortlist_size)
+            candidate_lists = [[index for index, _ in hits] for hits in hits_lists]
+        else:
+            candidate_lists = None
 
-        # Now adding the results to the question_bank dataframe
-        question_bank.insert(0, 'Relevance', relevance_scores_list)
-        question_bank.insert(1, 'Index', index_list)
-        question_bank.insert(2, 'Query', test_questions)
-        question_bank.insert(3, 'Answer', completion_response_list)
-        # Replace content of testint file with the new dataframe
-        question_bank.to_excel(testing_results, sheet_name='Sheet1', index=False, engine='openpyxl')
+        # Each answer is appended to testing_checkpoint as it arrives, re-running after a crash only asks the missing questions
+        records = asyncio.run(run_test_questions(test_questions, candidate_lists))
+        print(f"Answered {sum(record['error'] is None for record in records)} of {len(records)} test questions")
+
+        # Replace content of testint file with the question bank and the results
+        export_results(question_bank, records, testing_results)
 
     else:
         query = "What assignment do we have next?"
-        query = pre_process_query(query, html_text)
+        query = pre_process_query(query)
 
-        relevance_score, prompt_context, index = launch_cohere(sorted_nodes_text,
-                                                               query)  # get the prompt context for the chat complettion
-        completion_response = launch_chat_completion(query, prompt_context)  # this is where the chat completion happens
+        relevance_score, prompt_context, index = launch_cohere(query)  # get the prompt context for the chat complettion
         # print("First index: ", index)
         # print("First relevance_score: ", relevance_score)
-        print("First query:", query)
+        print("Query:", query)
         # print("First prompt_context:", prompt_context)
-        print("First Answer: ", completion_response)
+        if stream_answers:
+            print("Answer: ", end="")
+            completion_response = ""
+            for token in launch_chat_completion_stream(query, prompt_context):  # this is where the chat completion happens
+                print(token, end="", flush=True)
+                completion_response += token
+            print()
+        else:
+            completion_response = launch_chat_completion(query, prompt_context)  # this is where the chat completion happens
+            print("Answer: ", completion_response)
 
         # Some cleaning up of the answer
         # if "does not directly address the question" in completion_response:
         #    completion_response = "That is something I can't answer"
 
-        # If the response is "I don't know" from the Questions document, then use Syllabus
-        if "I don't know" in completion_response or "does not provide information" in completion_response or relevance_score < 0.01:
-            # file_source = "C:/Users/donal/OneDrive - York University/New/Al/Al-E/Syllabus6.docx"
-            file_source = "C:/Users/donal/OneDrive - York University/New/Roots of Modern Canada/0. General/_FW 2024-2025/Syllabus HUMA 1740 FW (2024-2025).docx"
-            doc = Document(file_source)
-
-            with open(file_source, "rb") as docx_file:
-                result = mammoth.convert_to_html(docx_file)  # this converts my doc to html
-                html_text = result.value
-
-            sections = find_h_level(doc)
-            section_paragraphs = find_sections_paragraphs(sections, doc)
-            nodes_text = convert_doc_to_nodes(section_paragraphs, doc)
-            doc_tables_df, table_titles = read_tables(html_text)
-            render_tables_add_to_nodes_text(table_titles, nodes_text, doc_tables_df)
-            sorted_nodes_text = clean_up(nodes_text, sections)
-            json_data = convert_to_dict(sorted_nodes_text, file_source)
-
-            relevance_score, prompt_context, index = launch_cohere(sorted_nodes_text, query)
-            completion_response = launch_chat_completion(query, prompt_context)
-            # print("Second index: ", index)
-            # print("Second relevance_score: ", relevance_score)
-            print("Second query:", query)
-            # print("Second prompt_context", prompt_context)
-            print("Second Answer: ", completion_response)
+        # The Questions document and the syllabus are one candidate pool, a single retrieval picks the best node of both
+        print("Source:", sorted_nodes_text[index]["metadata"]["source"], f"(relevance {relevance_score:.3f})")
+
+    course_registry.stop()
+
+    if retrieval_cache.path is not None:
+        retrieval_cache.save()
+    print(f"Retrieval cache: {retrieval_cache.hits} hits, {retrieval_cache.misses} misses")
 
     # -------------------------------------------------------------------------------------------#
     # Different models for Open